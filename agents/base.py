@@ -1,18 +1,58 @@
 # agents/base.py
-import pathlib
-from typing import Dict, Any
-from core.config import agent_conf, get_prompt_path, get_system_path
-from core.workspace import read_text
-from utils.llm import call_llm, safe_json_loads
+import json
+from contextlib import contextmanager
+from typing import Callable, Dict, Any
+from core.config import agent_conf, get_prompt_path, get_system_path, load_text
+from core.tracing import span
+from utils.llm import call_llm, acall_llm, stream_llm, astream_llm, discard_cached, safe_json_loads
 
 class BaseAgent:
     def __init__(self, agents_cfg: Dict[str, Any], role: str):
+        self.role = role
         self.conf = agent_conf(agents_cfg, role)
-        self.sys_prompt = read_text(pathlib.Path(get_system_path(self.conf)))
-        self.role_prompt = read_text(pathlib.Path(get_prompt_path(self.conf)))
+        # Cached per file: agents sharing prompts/system.md read it once
+        self.sys_prompt = load_text(get_system_path(self.conf))
+        self.role_prompt = load_text(get_prompt_path(self.conf))
     
     def call_llm(self, user_payload: str) -> str:
-        return call_llm(self.conf["model"], self.sys_prompt, user_payload)
+        with span("llm.call", role=self.role, model=self.conf["model"]):
+            return call_llm(self.conf["model"], self.sys_prompt, user_payload)
+
+    async def acall_llm(self, user_payload: str) -> str:
+        with span("llm.call", role=self.role, model=self.conf["model"]):
+            return await acall_llm(self.conf["model"], self.sys_prompt, user_payload)
+
+    def stream_llm(self, user_payload: str, on_text: Callable[[str], None]) -> str:
+        with span("llm.call", role=self.role, model=self.conf["model"]):
+            return stream_llm(self.conf["model"], self.sys_prompt, user_payload, on_text)
+
+    async def astream_llm(self, user_payload: str, on_text: Callable[[str], None]) -> str:
+        with span("llm.call", role=self.role, model=self.conf["model"]):
+            return await astream_llm(self.conf["model"], self.sys_prompt, user_payload, on_text)
     
+    def discard_response(self, user_payload: str) -> None:
+        """Drop the cached response to user_payload (one the agent could not use)."""
+        discard_cached(self.conf["model"], self.sys_prompt, user_payload)
+
+    @contextmanager
+    def checked(self, user_payload: str):
+        """Wrap parsing / validation of the response to user_payload: on failure its cache entry is dropped."""
+        try:
+            yield
+        except Exception:
+            self.discard_response(user_payload)
+            raise
+
+    def build_payload(self, context: Dict[str, Any], request: Dict[str, Any], prompt: str = None) -> str:
+        """
+        The user message: role prompt, then `context` (inputs that repeat across calls),
+        then `request` in order of volatility, most volatile last. Together with the
+        system prompt this keeps the longest possible identical prefix across calls,
+        which the provider's prompt cache can serve (see utils/prompt_cache.py).
+        """
+        data = dict(context)
+        data.update(request)
+        return f"{prompt or self.role_prompt}\n\n# INPUT\n{json.dumps(data, ensure_ascii=False)}"
+
     def safe_json_loads(self, text: str, log_func=None) -> Any:
         return safe_json_loads(text, log_func)
@@ -1,66 +1,312 @@
 # agents/coder.py
-import json
+import hashlib
 import pathlib
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from agents.base import BaseAgent
-from core.workspace import read_text, ensure_in_workspace, ensure_package_structure
-from utils.validation import CODER_VALIDATOR
-import jsonschema
+from core.context import compact_feedback, pack_context
+from core.patching import PatchConflictError, apply_hunks
+from core.tracing import span
+from core.workspace import read_text, ensure_in_workspace, ensure_package_structure, write_files
+from utils.json_stream import IncrementalJSONParser, StreamAbort
+from utils.validation import CODER_VALIDATOR, SchemaValidationError, StreamValidator
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _check_path(rel: str, artifacts: List[str], workspace_path: pathlib.Path) -> pathlib.Path:
+    """Artifact-only policy + workspace scope for one edit path."""
+    if artifacts and rel not in artifacts:
+        raise RuntimeError(f"Coder attempted to modify non-artifact file: {rel}")
+    return ensure_in_workspace(rel, workspace_path)
+
+def _stage(e: Dict[str, Any], artifacts: List[str], base: Dict[str, str], workspace_path: pathlib.Path,
+           staged: Dict[pathlib.Path, str]) -> Tuple[pathlib.Path, str]:
+    """
+    (target, new content) for one validated edit. A later edit to a path already in
+    staged builds on the staged content, so edits to one file in one response compose.
+    """
+    rel = e["path"]
+    target = _check_path(rel, artifacts, workspace_path)
+    sent = base.get(rel, "")
+    if "content" in e:
+        if sent.startswith("partial:"):
+            raise PatchConflictError(f"Full content for {rel}, which was only partially shown")
+        return target, e["content"]
+    if target in staged:
+        return target, apply_hunks(staged[target], e["hunks"], rel)
+    if not target.is_file():
+        raise PatchConflictError(f"Hunks for {rel}: file does not exist")
+    current = read_text(target)
+    if sent and _digest(current) != sent.split(":")[-1]:
+        raise PatchConflictError(f"Hunks for {rel}: file changed since it was read")
+    return target, apply_hunks(current, e["hunks"], rel)
+
+def _proposal(task: Dict[str, Any], base: Dict[str, str], staged: Dict[pathlib.Path, str],
+              edited_paths: List[str]) -> Dict[str, Any]:
+    artifacts = task.get("artifacts", []) or []
+    # What the proposal was based on: digest of each artifact as sent to the model (None if absent)
+    read = {rel: (base[rel].split(":")[-1] if rel in base else None)
+            for rel in set(artifacts) | set(edited_paths)}
+    return {"task_id": task.get("id", ""), "staged": staged, "edits": edited_paths, "read": read}
+
+def _with_rejection(feedback: Optional[str], reason: Optional[str]) -> Optional[str]:
+    if not reason:
+        return feedback
+    note = (f"Your previous response was rejected before it was complete: {reason}. "
+            f"Return JSON that follows the schema and edit only the task's artifacts.")
+    return f"{note}\n\n{feedback}" if feedback else note
+
+class _EditStream:
+    """
+    A streamed coder response, checked while it arrives: every value against the
+    coder schema and every edit path against the task's artifacts as soon as it is
+    complete. Each edit is resolved when its object closes and, with write=True,
+    written at once (atomically per file); rollback() puts those files back.
+    """
+
+    def __init__(self, task: Dict[str, Any], base: Dict[str, str], workspace_path: pathlib.Path,
+                 write: bool = False):
+        self.task = task
+        self.base = base
+        self.workspace_path = workspace_path
+        self.write = write
+        self.artifacts = task.get("artifacts", []) or []
+        self.schema = StreamValidator(CODER_VALIDATOR)
+        self.parser = IncrementalJSONParser(self._on_value, self._on_open)
+        self.staged: Dict[pathlib.Path, str] = {}
+        self.edits: List[str] = []
+        # Content before the first early write of each file (None: it didn't exist)
+        self.previous: Dict[pathlib.Path, Optional[bytes]] = {}
+
+    def feed(self, text: str) -> None:
+        self.parser.feed(text)
+
+    def _on_open(self, path, kind: str) -> None:
+        try:
+            self.schema.on_open(path, kind)
+        except SchemaValidationError as e:
+            raise StreamAbort(f"Invalid coder response format: {e.message}")
+
+    def _on_value(self, path, value) -> None:
+        try:
+            self.schema.on_value(path, value)
+        except SchemaValidationError as e:
+            raise StreamAbort(f"Invalid coder response format: {e.message}")
+        if len(path) == 3 and path[0] == "edits" and path[2] == "path":
+            # Reject a bad path before its content streams in
+            try:
+                _check_path(value, self.artifacts, self.workspace_path)
+            except RuntimeError as e:
+                raise StreamAbort(str(e))
+        elif len(path) == 2 and path[0] == "edits":
+            target, content = _stage(value, self.artifacts, self.base, self.workspace_path, self.staged)
+            self.staged[target] = content
+            if value["path"] not in self.edits:
+                self.edits.append(value["path"])
+            if self.write:
+                if target not in self.previous:
+                    self.previous[target] = target.read_bytes() if target.is_file() else None
+                write_files({target: content})
+
+    def proposal(self) -> Dict[str, Any]:
+        doc = self.parser.close()
+        try:
+            CODER_VALIDATOR.validate(doc)
+        except SchemaValidationError as e:
+            raise StreamAbort(f"Invalid coder response format: {e.message}")
+        return dict(_proposal(self.task, self.base, self.staged, self.edits), written=self.write)
+
+    def rollback(self) -> None:
+        write_files({t: data for t, data in self.previous.items() if data is not None})
+        for t, data in self.previous.items():
+            if data is None:
+                t.unlink(missing_ok=True)
+        self.previous.clear()
 
 class CoderAgent(BaseAgent):
     def __init__(self, agents_cfg: Dict[str, Any]):
         super().__init__(agents_cfg, "coder")
-    
-    def code(self, task: Dict[str, Any], workspace_path: pathlib.Path, 
+        # "full": edits carry whole file contents; "patch": existing files may be edited with search/replace hunks
+        self.edit_mode = self.conf.get("edit_mode", "full")
+        # Prompt budgets (approximate tokens); None disables packing
+        self.context_tokens = self.conf.get("context_tokens")
+        self.feedback_tokens = int(self.conf.get("feedback_tokens", 1000))
+        # Streamed responses are checked as they arrive; an invalid one is aborted and retried
+        self.stream = bool(self.conf.get("stream", False))
+        self.stream_retries = int(self.conf.get("stream_retries", 1))
+
+    def code(self, task: Dict[str, Any], workspace_path: pathlib.Path,
              feedback: str = None, project_root: str = None, log_func=None) -> Dict[str, Any]:
+        # Streaming writes each file as soon as its edit is complete
+        proposal = self._propose(task, workspace_path, feedback, project_root, log_func, write=self.stream)
+        return self.commit(proposal, workspace_path, project_root, log_func)
+
+    async def acode(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+                    feedback: str = None, project_root: str = None, log_func=None) -> Dict[str, Any]:
+        proposal = await self._apropose(task, workspace_path, feedback, project_root, log_func, write=self.stream)
+        return self.commit(proposal, workspace_path, project_root, log_func)
+
+    def propose(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+                feedback: str = None, project_root: str = None, log_func=None) -> Dict[str, Any]:
+        """
+        Ask the model for edits and resolve them to final file contents without writing
+        anything. commit() writes a proposal; is_current() tells whether it still applies.
+        """
+        return self._propose(task, workspace_path, feedback, project_root, log_func)
+
+    async def apropose(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+                       feedback: str = None, project_root: str = None, log_func=None) -> Dict[str, Any]:
+        return await self._apropose(task, workspace_path, feedback, project_root, log_func)
+
+    def _propose(self, task, workspace_path, feedback, project_root, log_func, write=False):
+        try:
+            return self._attempt(task, workspace_path, feedback, project_root, log_func, self.edit_mode, True, write)
+        except PatchConflictError as e:
+            # Fall back to full-file edits for this call
+            log_func("coder", "patch_conflict", {"task_id": task.get("id", ""), "error": str(e)})
+            return self._attempt(task, workspace_path, feedback, project_root, log_func, "full", False, write)
+
+    async def _apropose(self, task, workspace_path, feedback, project_root, log_func, write=False):
+        try:
+            return await self._aattempt(task, workspace_path, feedback, project_root, log_func,
+                                        self.edit_mode, True, write)
+        except PatchConflictError as e:
+            log_func("coder", "patch_conflict", {"task_id": task.get("id", ""), "error": str(e)})
+            return await self._aattempt(task, workspace_path, feedback, project_root, log_func, "full", False, write)
+
+    def _attempt(self, task, workspace_path, feedback, project_root, log_func, edit_mode, pack, write):
+        if not self.stream:
+            payload, base = self._payload(task, workspace_path, feedback, project_root, edit_mode, pack=pack)
+            out = self.call_llm(payload)
+            with self.checked(payload):
+                return self._resolve(out, base, task, workspace_path, log_func)
+        reason = None
+        for attempt in range(self.stream_retries + 1):
+            payload, base = self._payload(task, workspace_path, _with_rejection(feedback, reason),
+                                          project_root, edit_mode, pack=pack)
+            stream = _EditStream(task, base, workspace_path, write)
+            try:
+                self.stream_llm(payload, stream.feed)
+                with self.checked(payload):
+                    return stream.proposal()
+            except StreamAbort as e:
+                reason = self._aborted(stream, task, e, attempt, log_func)
+            except BaseException:
+                stream.rollback()
+                raise
+
+    async def _aattempt(self, task, workspace_path, feedback, project_root, log_func, edit_mode, pack, write):
+        if not self.stream:
+            payload, base = self._payload(task, workspace_path, feedback, project_root, edit_mode, pack=pack)
+            out = await self.acall_llm(payload)
+            with self.checked(payload):
+                return self._resolve(out, base, task, workspace_path, log_func)
+        reason = None
+        for attempt in range(self.stream_retries + 1):
+            payload, base = self._payload(task, workspace_path, _with_rejection(feedback, reason),
+                                          project_root, edit_mode, pack=pack)
+            stream = _EditStream(task, base, workspace_path, write)
+            try:
+                await self.astream_llm(payload, stream.feed)
+                with self.checked(payload):
+                    return stream.proposal()
+            except StreamAbort as e:
+                reason = self._aborted(stream, task, e, attempt, log_func)
+            except BaseException:
+                stream.rollback()
+                raise
+
+    def _aborted(self, stream: _EditStream, task: Dict[str, Any], e: StreamAbort, attempt: int, log_func) -> str:
+        """Undo early writes and log an aborted stream; re-raises once the retries are used up."""
+        stream.rollback()
+        log_func("coder", "stream_abort", {"task_id": task.get("id", ""), "reason": str(e),
+                                           "chars": stream.parser.chars, "attempt": attempt})
+        if attempt >= self.stream_retries:
+            raise e
+        return str(e)
+
+    def _payload(self, task: Dict[str, Any], workspace_path: pathlib.Path, feedback: str = None,
+                 project_root: str = None, edit_mode: str = "full", pack: bool = True) -> Tuple[str, Dict[str, str]]:
+        """
+        Returns (payload, base): base maps each context file to the digest of its current
+        content, and marks files sent only partially (see core/context.pack_context).
+        """
         # Build context_files ONLY for existing artifacts
         artifacts = task.get("artifacts", []) or []
         context_files = []
+        base: Dict[str, str] = {}
         for rel in artifacts:
             p = (workspace_path / rel)
             if p.exists() and p.is_file():
-                context_files.append({"path": rel, "content": read_text(p)})
+                content = read_text(p)
+                context_files.append({"path": rel, "content": content})
+                base[rel] = _digest(content)
+
+        if feedback:
+            feedback = compact_feedback(feedback, self.feedback_tokens)
+        if pack and self.context_tokens:
+            context_files = pack_context(context_files, int(self.context_tokens), feedback)
+            if any(f.get("partial") for f in context_files):
+                # Partial files can only be edited with hunks
+                edit_mode = "patch"
+                for f in context_files:
+                    if f.get("partial"):
+                        base[f["path"]] = "partial:" + base[f["path"]]
 
         task_obj = dict(task)  # copy
         if feedback:
             task_obj["feedback"] = feedback
-        
-        # Add project context
-        if project_root:
-            task_obj["project_root"] = project_root
-
-        coder_input = {
-            "task": task_obj,
-            "context_files": context_files
-        }
-
-        payload = f"{self.role_prompt}\n\n# INPUT\n{json.dumps(coder_input, ensure_ascii=False)}"
-        out = self.call_llm(payload)
+
+        # Stable project context first; the task (with feedback and candidate hints at its
+        # end) last, so retries and parallel candidates over the same files share the prefix
+        context = {"project_root": project_root} if project_root else {}
+        request = {"edit_mode": edit_mode, "context_files": context_files, "task": task_obj}
+        return self.build_payload(context, request), base
+
+    def _resolve(self, out: str, base: Dict[str, str], task: Dict[str, Any],
+                 workspace_path: pathlib.Path, log_func=None) -> Dict[str, Any]:
+        """Validate the coder response and compute every edited file's new content."""
+        artifacts = task.get("artifacts", []) or []
         result = self.safe_json_loads(out, log_func)
 
         # Validate coder response schema
         try:
             CODER_VALIDATOR.validate(result)
-        except jsonschema.ValidationError as e:
+        except SchemaValidationError as e:
             log_func("coder", "validation_error", {"error": str(e), "result": result})
             raise RuntimeError(f"Invalid coder response format: {e.message}")
 
-        # Apply edits (validate workspace scope + artifact-only policy)
+        # Resolve every edit before writing anything (validate workspace scope + artifact-only policy)
         edits = result.get("edits", [])
+        staged: Dict[pathlib.Path, str] = {}
         edited_paths: List[str] = []
-        for e in edits:
-            rel = e["path"]
-            content = e["content"]
-            if artifacts and rel not in artifacts:
-                raise RuntimeError(f"Coder attempted to modify non-artifact file: {rel}")
-            target = ensure_in_workspace(rel, workspace_path)
-            target.parent.mkdir(parents=True, exist_ok=True)
-            target.write_text(content, encoding="utf-8")
-            edited_paths.append(rel)
-
-        # Auto-create missing __init__.py files for packages
-        if project_root:
-            ensure_package_structure(project_root, workspace_path)
-        
-        log_func("coder", "patch", {"task_id": task.get("id", ""), "files": edited_paths})
-        return {"edits": edited_paths}
+        with span("coder.apply_edits", task_id=task.get("id", ""), files=len(edits)):
+            for e in edits:
+                target, content = _stage(e, artifacts, base, workspace_path, staged)
+                staged[target] = content
+                if e["path"] not in edited_paths:
+                    edited_paths.append(e["path"])
+        return _proposal(task, base, staged, edited_paths)
+
+    def is_current(self, proposal: Dict[str, Any], workspace_path: pathlib.Path) -> bool:
+        """True if none of the files the proposal was based on changed since."""
+        for rel, digest in proposal["read"].items():
+            p = workspace_path / rel
+            current = _digest(read_text(p)) if p.is_file() else None
+            if current != digest:
+                return False
+        return True
+
+    def commit(self, proposal: Dict[str, Any], workspace_path: pathlib.Path,
+               project_root: str = None, log_func=None) -> Dict[str, Any]:
+        """Write a proposal's files (all or nothing); a streamed one may already be written."""
+        with span("coder.commit", task_id=proposal["task_id"], files=len(proposal["staged"])):
+            if not proposal.get("written"):
+                write_files(proposal["staged"])
+
+            # Auto-create missing __init__.py files for packages
+            if project_root:
+                ensure_package_structure(project_root, workspace_path)
+
+        log_func("coder", "patch", {"task_id": proposal["task_id"], "files": proposal["edits"]})
+        return {"edits": proposal["edits"]}
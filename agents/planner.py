@@ -1,33 +1,42 @@
 # agents/planner.py
-import json
 import pathlib
 from typing import Dict, Any
 from agents.base import BaseAgent
 from core.workspace import repo_summary
-from utils.validation import PLANNER_VALIDATOR
-import jsonschema
+from utils.validation import PLANNER_VALIDATOR, SchemaValidationError
 
 class PlannerAgent(BaseAgent):
     def __init__(self, agents_cfg: Dict[str, Any]):
         super().__init__(agents_cfg, "planner")
     
     def plan(self, goal: str, workspace_path: pathlib.Path, run_id: str, log_func) -> Dict[str, Any]:
-        plan_input = {
-            "goal": goal,
-            "repo_summary": repo_summary(workspace_path),
-            "plan_id": f"plan_{run_id}"
-        }
-
-        payload = f"{self.role_prompt}\n\n# INPUT\n{json.dumps(plan_input, ensure_ascii=False)}"
+        payload = self._payload(goal, workspace_path)
         out = self.call_llm(payload)
+        with self.checked(payload):
+            return self._finish(out, run_id, log_func)
+
+    async def aplan(self, goal: str, workspace_path: pathlib.Path, run_id: str, log_func) -> Dict[str, Any]:
+        payload = self._payload(goal, workspace_path)
+        out = await self.acall_llm(payload)
+        with self.checked(payload):
+            return self._finish(out, run_id, log_func)
+
+    def _payload(self, goal: str, workspace_path: pathlib.Path) -> str:
+        # The repository is shared by every goal run against it. The run's plan_id is
+        # set in _finish, not sent: it would make every run's prompt (and cache key) unique
+        context = {"repo_summary": repo_summary(workspace_path, max_tokens=self.conf.get("summary_tokens"))}
+        return self.build_payload(context, {"goal": goal})
+
+    def _finish(self, out: str, run_id: str, log_func) -> Dict[str, Any]:
         plan = self.safe_json_loads(out, log_func)
         
         # Validate plan schema
         try:
             PLANNER_VALIDATOR.validate(plan)
-        except jsonschema.ValidationError as e:
+        except SchemaValidationError as e:
             log_func("planner", "validation_error", {"error": str(e), "plan": plan})
             raise RuntimeError(f"Invalid plan format: {e.message}")
-        
+
+        plan["plan_id"] = f"plan_{run_id}"
         log_func("planner", "plan", plan)
         return plan
@@ -1,23 +1,110 @@
 # agents/tester.py
-import json
 import pathlib
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List
 from agents.base import BaseAgent
-from core.execution import allow_exec
+from core.execution import allow_exec, allow_exec_async
+from core.impact import select_tests
+from core.config import load_text
 from core.workspace import ensure_package_structure
-from utils.validation import TESTER_VALIDATOR
-import jsonschema
+from utils.validation import TESTER_VALIDATOR, DIAGNOSIS_VALIDATOR, SchemaValidationError
+
+def truncate_report(output: str, limit: int = 4000, head: int = 2500, tail: int = 1000) -> str:
+    """Truncation rule from prompts/tester.md: first 2500 chars + "\n...\n" + last 1000 chars."""
+    if len(output) <= limit:
+        return output
+    return output[:head] + "\n...\n" + output[-tail:]
+
+# pytest's final summary line, e.g. "2 failed, 5 passed in 0.12s"
+_PYTEST_SUMMARY = re.compile(r"\b\d+ (passed|failed|errors?|skipped)\b.* in [\d.]+s")
+_PYTEST_COUNTS = re.compile(r"(\d+) (failed|errors?)\b")
+
+def count_failures(result: Dict[str, Any]) -> float:
+    """
+    Failed + errored tests from the pytest summary in a test result's report: 0 if it
+    passed, infinity if it failed without a parsable summary (e.g. a collection error).
+    """
+    if result.get("passed", False):
+        return 0
+    for line in reversed(result.get("report", "").splitlines()):
+        if _PYTEST_SUMMARY.search(line):
+            counts = [int(n) for n, _ in _PYTEST_COUNTS.findall(line)]
+            return sum(counts) if counts else float("inf")
+    return float("inf")
 
 class TesterAgent(BaseAgent):
     def __init__(self, agents_cfg: Dict[str, Any]):
         super().__init__(agents_cfg, "tester")
-    
-    def test(self, task: Dict[str, Any], workspace_path: pathlib.Path, 
-             project_root: str = None, test_folder_root: str = None, log_func=None) -> Dict[str, Any]:
+        # "local": derive passed/report from the exit code without a model call; "llm": ask the model
+        self.mode = self.conf.get("mode", "local")
+        self.diagnose_failures = bool(self.conf.get("diagnose_failures", False))
+        self.diagnose_prompt = None
+        if self.diagnose_failures:
+            self.diagnose_prompt = load_text(self.conf.get("diagnose_prompt", "prompts/diagnose.md"))
+
+    def test(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+             project_root: str = None, test_folder_root: str = None, log_func=None,
+             changed: List[str] = None, isolated: bool = False) -> Dict[str, Any]:
+        cmd, selected = self._select(self._command(task, workspace_path, project_root, test_folder_root),
+                                     workspace_path, changed)
+
+        # Run tests (isolated: cold subprocess, e.g. for a throwaway overlay workspace)
+        proc = allow_exec(cmd, str(workspace_path), timeout=120, isolated=isolated)
+        exit_code = proc.returncode
+        output = (proc.stdout or "") + (proc.stderr or "")
+
+        # If import failed, try to fix package structure
+        if self._needs_package_fix(exit_code, output, project_root, workspace_path):
+            # Retry the test
+            proc = allow_exec(cmd, str(workspace_path), timeout=120, isolated=isolated)
+            exit_code = proc.returncode
+            output = (proc.stdout or "") + (proc.stderr or "")
+
+        if self.mode == "local":
+            result = self._local_result(task, exit_code, output, selected)
+            if exit_code != 0 and self.diagnose_failures:
+                payload = self._diagnose_payload(task, exit_code, output)
+                result = self._add_diagnosis(result, self.call_llm(payload), payload, log_func)
+            return self._finish(result, log_func)
+
+        payload = self._payload(task, exit_code, output)
+        out = self.call_llm(payload)
+        with self.checked(payload):
+            return self._finish(self._mark_selected(self.safe_json_loads(out, log_func), selected), log_func)
+
+    async def atest(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+                    project_root: str = None, test_folder_root: str = None, log_func=None,
+                    changed: List[str] = None, isolated: bool = False) -> Dict[str, Any]:
+        cmd, selected = self._select(self._command(task, workspace_path, project_root, test_folder_root),
+                                     workspace_path, changed)
+
+        proc = await allow_exec_async(cmd, str(workspace_path), timeout=120, isolated=isolated)
+        exit_code = proc.returncode
+        output = (proc.stdout or "") + (proc.stderr or "")
+
+        if self._needs_package_fix(exit_code, output, project_root, workspace_path):
+            proc = await allow_exec_async(cmd, str(workspace_path), timeout=120, isolated=isolated)
+            exit_code = proc.returncode
+            output = (proc.stdout or "") + (proc.stderr or "")
+
+        if self.mode == "local":
+            result = self._local_result(task, exit_code, output, selected)
+            if exit_code != 0 and self.diagnose_failures:
+                payload = self._diagnose_payload(task, exit_code, output)
+                result = self._add_diagnosis(result, await self.acall_llm(payload), payload, log_func)
+            return self._finish(result, log_func)
+
+        payload = self._payload(task, exit_code, output)
+        out = await self.acall_llm(payload)
+        with self.checked(payload):
+            return self._finish(self._mark_selected(self.safe_json_loads(out, log_func), selected), log_func)
+
+    def _command(self, task: Dict[str, Any], workspace_path: pathlib.Path,
+                 project_root: str = None, test_folder_root: str = None) -> List[str]:
         # Build pytest command based on task artifacts and plan roots
         artifacts = task.get("artifacts", []) or []
         test_files = [artif for artif in artifacts if artif.endswith(".py") and "test" in artif]
-        
+
         if test_files:
             # Run specific test files mentioned in task artifacts
             cmd = ["pytest", "-q"] + test_files
@@ -51,36 +138,75 @@ class TesterAgent(BaseAgent):
             else:
                 # Fallback: run pytest with collect-only to see what would be tested
                 cmd = ["pytest", "--collect-only", "-q"]
+        return cmd
 
-        # Run tests
-        proc = allow_exec(cmd, str(workspace_path), timeout=120)
-        exit_code = proc.returncode
-        output = (proc.stdout or "") + (proc.stderr or "")
-        
-        # If import failed, try to fix package structure
+    def _select(self, cmd: List[str], workspace_path: pathlib.Path,
+                changed: List[str] = None):
+        """
+        Narrow a whole-directory pytest run to the test files that depend on `changed`.
+        Returns (cmd, selected_files); selected_files is None when the command is unchanged.
+        """
+        if not changed or len(cmd) != 3 or cmd[:2] != ["pytest", "-q"]:
+            return cmd, None
+        if not (workspace_path / cmd[2]).is_dir():
+            return cmd, None
+        selected = select_tests(workspace_path, changed, cmd[2])
+        if not selected:
+            return cmd, None
+        return ["pytest", "-q"] + selected, selected
+
+    def _needs_package_fix(self, exit_code: int, output: str, project_root: str,
+                           workspace_path: pathlib.Path) -> bool:
+        """If the run failed on a missing project package, repair package structure and ask for a retry."""
         if exit_code != 0 and "ModuleNotFoundError" in output and project_root:
             if "No module named" in output and project_root in output:
                 print(f"Detected missing package structure for {project_root}, attempting fix...")
                 ensure_package_structure(project_root, workspace_path)
-                # Retry the test
-                proc = allow_exec(cmd, str(workspace_path), timeout=120)
-                exit_code = proc.returncode
-                output = (proc.stdout or "") + (proc.stderr or "")
+                return True
+        return False
+
+    def _payload(self, task: Dict[str, Any], exit_code: int, output: str) -> str:
+        return self.build_payload({"task_id": task.get("id", "")},
+                                  {"pytest_exit_code": exit_code, "pytest_output": output})
 
-        tester_input = {
+    def _local_result(self, task: Dict[str, Any], exit_code: int, output: str,
+                      selected: List[str] = None) -> Dict[str, Any]:
+        result = {
             "task_id": task.get("id", ""),
-            "pytest_exit_code": exit_code,
-            "pytest_output": output
+            "passed": exit_code == 0,
+            "report": truncate_report(output)
         }
+        if selected is not None:
+            result["selected_tests"] = selected
+        return result
 
-        payload = f"{self.role_prompt}\n\n# INPUT\n{json.dumps(tester_input, ensure_ascii=False)}"
-        out = self.call_llm(payload)
-        result = self.safe_json_loads(out, log_func)
+    def _mark_selected(self, result: Any, selected: List[str] = None) -> Any:
+        if selected is not None and isinstance(result, dict):
+            result = dict(result, selected_tests=selected)
+        return result
+
+    def _diagnose_payload(self, task: Dict[str, Any], exit_code: int, output: str) -> str:
+        return self.build_payload({"task_id": task.get("id", ""), "acceptance": task.get("acceptance", "")},
+                                  {"pytest_exit_code": exit_code, "pytest_output": truncate_report(output)},
+                                  prompt=self.diagnose_prompt)
+
+    def _add_diagnosis(self, result: Dict[str, Any], out: str, payload: str, log_func) -> Dict[str, Any]:
+        diagnosis = None
+        try:
+            diagnosis = self.safe_json_loads(out, log_func)
+            DIAGNOSIS_VALIDATOR.validate(diagnosis)
+        except (RuntimeError, SchemaValidationError) as e:
+            # The diagnosis is advisory; keep the mechanical result
+            log_func("tester", "validation_error", {"error": str(e), "result": diagnosis})
+            self.discard_response(payload)
+            return result
+        return dict(result, diagnosis=diagnosis["diagnosis"])
 
+    def _finish(self, result: Dict[str, Any], log_func) -> Dict[str, Any]:
         # Validate tester response schema
         try:
             TESTER_VALIDATOR.validate(result)
-        except jsonschema.ValidationError as e:
+        except SchemaValidationError as e:
             log_func("tester", "validation_error", {"error": str(e), "result": result})
             raise RuntimeError(f"Invalid tester response format: {e.message}")
 
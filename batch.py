@@ -0,0 +1,171 @@
+# batch.py
+"""
+Run many goals at once. Each task YAML (a file with a `goal`, like
+config/example_tasks/*.yaml) gets its own workspace, run id, log and state file
+and runs in a worker process; all workers share one cap on in-flight LLM calls.
+
+    python batch.py config/example_tasks
+    python batch.py goals/a.yaml goals/b.yaml --workers 8 --llm-concurrency 16
+
+Defaults come from the `batch` section of policies.yaml. The aggregate report is
+printed and written to runs/<batch_id>.report.json.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import pathlib
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, List
+
+def find_task_files(paths: List[str]) -> List[pathlib.Path]:
+    """Task YAMLs from files and directories (*.yaml / *.yml, sorted)."""
+    found: List[pathlib.Path] = []
+    for p in map(pathlib.Path, paths):
+        if p.is_dir():
+            found.extend(sorted(x for x in p.iterdir() if x.suffix in (".yaml", ".yml")))
+        elif p.is_file():
+            found.append(p)
+        else:
+            raise FileNotFoundError(f"No such task file or directory: {p}")
+    return found
+
+def goal_name(path: pathlib.Path) -> str:
+    name = path.stem
+    return name[len("tasks_"):] if name.startswith("tasks_") else name
+
+def _init_worker(llm_limit) -> None:
+    from utils.llm import configure_global_limit
+    configure_global_limit(llm_limit)
+
+def _run_goal(task_file: str, name: str, batch_id: str, workspace_root: str) -> Dict[str, Any]:
+    """Run one goal in this worker process; console output goes to <workspace_root>/<name>.out."""
+    import orchestrator
+    from core.config import load_yaml
+    from core.tracing import get_tracer
+
+    tasks_cfg = load_yaml(task_file) or {}
+    goal = tasks_cfg.get("goal") or tasks_cfg.get("mvp")
+    run_id = f"{batch_id}-{name}"
+    workspace = pathlib.Path(workspace_root) / name
+    workspace.mkdir(parents=True, exist_ok=True)
+    result: Dict[str, Any] = {"goal": name, "task_file": task_file, "run_id": run_id,
+                              "workspace": str(workspace), "log": f"runs/{run_id}.log.jsonl"}
+    start = time.perf_counter()
+    with open(pathlib.Path(workspace_root) / f"{name}.out", "w", encoding="utf-8") as out, \
+            contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        try:
+            if not goal:
+                raise RuntimeError(f"No 'goal' found in {task_file}")
+            status = orchestrator.run(goal=goal, workspace=workspace, run_id=run_id)
+            result["status"] = status
+        except Exception as e:
+            traceback.print_exc()
+            result["error"] = f"{type(e).__name__}: {e}"
+    result["wall_s"] = time.perf_counter() - start
+    llm = get_tracer().aggregate().get("llm.call", {})
+    result["llm_calls"] = llm.get("count", 0)
+    result["tokens"] = llm.get("prompt_tokens", 0) + llm.get("completion_tokens", 0)
+    result["cost_usd"] = llm.get("cost_usd", 0.0)
+    return result
+
+def run_batch(task_files: List[pathlib.Path], workers: int, llm_concurrency: int,
+              workspace_root: str = "workspaces") -> Dict[str, Any]:
+    batch_id = "batch-" + datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    root = pathlib.Path(workspace_root) / batch_id
+    root.mkdir(parents=True, exist_ok=True)
+    names: Dict[str, int] = {}
+    jobs = []
+    for path in task_files:
+        name = goal_name(path)
+        names[name] = names.get(name, 0) + 1
+        if names[name] > 1:
+            name = f"{name}-{names[name]}"
+        jobs.append((str(path), name))
+
+    ctx = multiprocessing.get_context("spawn")
+    # One semaphore shared by every worker: the global cap on in-flight LLM calls
+    llm_limit = ctx.BoundedSemaphore(llm_concurrency)
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(llm_limit,)) as pool:
+        futures = {pool.submit(_run_goal, path, name, batch_id, str(root)): name for path, name in jobs}
+        for fut in as_completed(futures):
+            try:
+                res = fut.result()
+            except Exception as e:  # the worker process itself died
+                res = {"goal": futures[fut], "error": f"{type(e).__name__}: {e}", "wall_s": 0.0,
+                       "llm_calls": 0, "tokens": 0, "cost_usd": 0.0}
+            results.append(res)
+            print(f"[{len(results)}/{len(jobs)}] {res['goal']}: {_outcome(res)} ({res['wall_s']:.1f}s)")
+    wall = time.perf_counter() - start
+
+    results.sort(key=lambda r: r["goal"])
+    report = {
+        "batch_id": batch_id,
+        "workers": workers,
+        "llm_concurrency": llm_concurrency,
+        "workspace_root": str(root),
+        "wall_s": wall,
+        "goals": len(results),
+        "succeeded": sum(1 for r in results if _outcome(r) == "passed"),
+        # Sum of per-goal wall time over batch wall time: the effective parallelism
+        "speedup": sum(r["wall_s"] for r in results) / wall if wall else 0.0,
+        "goals_per_hour": len(results) * 3600.0 / wall if wall else 0.0,
+        "llm_calls": sum(r["llm_calls"] for r in results),
+        "tokens": sum(r["tokens"] for r in results),
+        "cost_usd": sum(r["cost_usd"] for r in results),
+        "results": results,
+    }
+    out = pathlib.Path("runs") / f"{batch_id}.report.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    report["report_file"] = str(out)
+    return report
+
+def _outcome(res: Dict[str, Any]) -> str:
+    if res.get("error"):
+        return "error"
+    status = res.get("status", {})
+    return "passed" if status and all(s == "passed" for s in status.values()) else "failed"
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'goal':<24}{'result':>8}{'tasks':>8}{'wall s':>9}{'llm':>6}{'tokens':>10}{'cost $':>9}"]
+    lines.append("-" * len(lines[0]))
+    for r in report["results"]:
+        status = r.get("status") or {}
+        tasks = f"{sum(1 for s in status.values() if s == 'passed')}/{len(status)}" if status else "-"
+        lines.append(f"{r['goal']:<24}{_outcome(r):>8}{tasks:>8}{r['wall_s']:>9.1f}{r['llm_calls']:>6}"
+                     f"{r['tokens']:>10}{r['cost_usd']:>9.4f}")
+    lines.append(f"{report['succeeded']}/{report['goals']} goals passed in {report['wall_s']:.1f}s "
+                 f"({report['goals_per_hour']:.1f} goals/h, {report['speedup']:.1f}x parallel speedup, "
+                 f"{report['llm_calls']} LLM calls, ${report['cost_usd']:.4f})")
+    return "\n".join(lines)
+
+def main(argv=None) -> int:
+    from core.config import load_policies_cfg
+    cfg = load_policies_cfg().get("batch") or {}
+    parser = argparse.ArgumentParser(description="Run many goals in parallel, one workspace each.")
+    parser.add_argument("paths", nargs="+", help="task YAML files or directories of them")
+    parser.add_argument("--workers", type=int, default=int(cfg.get("workers", multiprocessing.cpu_count())))
+    parser.add_argument("--llm-concurrency", type=int, default=int(cfg.get("llm_concurrency", 8)),
+                        help="max in-flight LLM calls across all workers")
+    parser.add_argument("--workspace-root", default=cfg.get("workspace_root", "workspaces"))
+    args = parser.parse_args(argv)
+
+    task_files = find_task_files(args.paths)
+    if not task_files:
+        print("No task files found.")
+        return 1
+    report = run_batch(task_files, max(1, args.workers), max(1, args.llm_concurrency), args.workspace_root)
+    print(format_report(report))
+    print(f"Report: {report['report_file']}")
+    return 0 if report["succeeded"] == report["goals"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+# benchmark.py
+"""
+Offline benchmark: drives orchestrator.run end to end against the mock LLM
+backend (utils/mock_llm.py), so orchestrator overhead can be measured without
+network access or model costs.
+
+Scenarios: the config/example_tasks goals (fibonacci, snake, tic_tac_toe) and
+synthetic:N plans of N generated tasks. Every run happens in a fresh process and
+a fresh temporary directory that holds its workspace and its run log and state
+(removed afterwards unless --keep); the report has throughput, p50/p99 per traced phase
+and peak memory, and can be compared against a saved baseline.
+
+    python benchmark.py
+    python benchmark.py --scenarios synthetic:50 --latency lognormal:800:0.6 --max-parallel 8
+    python benchmark.py --out runs/bench.json --baseline runs/bench-main.json
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import pathlib
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, Any, List
+
+EXAMPLES = pathlib.Path("config/example_tasks")
+DEFAULT_SCENARIOS = "fibonacci,snake,tic_tac_toe,synthetic:10"
+
+def parse_latency(spec: str) -> Dict[str, Any]:
+    """fixed:MS | uniform:LOW:HIGH | normal:MEAN:STDDEV | lognormal:MEDIAN:SIGMA"""
+    parts = spec.split(":")
+    dist, args = parts[0], [float(x) for x in parts[1:]]
+    keys = {"fixed": ["ms"], "uniform": ["low_ms", "high_ms"], "normal": ["mean_ms", "stddev_ms"],
+            "lognormal": ["median_ms", "sigma"]}
+    if dist not in keys or len(args) != len(keys[dist]):
+        raise ValueError(f"Bad latency spec: '{spec}'")
+    return dict(zip(keys[dist], args), dist=dist)
+
+def scenario_goal(name: str) -> Dict[str, Any]:
+    """(goal, synthetic responder options) for a scenario name."""
+    if name.startswith("synthetic:"):
+        n = int(name.split(":", 1)[1])
+        return {"goal": f"Synthetic benchmark goal: implement {n} independent modules.",
+                "synthetic": {"n_tasks": n}}
+    from core.config import load_yaml
+    path = EXAMPLES / f"tasks_{name}.yaml"
+    if not path.exists():
+        raise ValueError(f"Unknown scenario: '{name}' (no {path})")
+    return {"goal": load_yaml(path)["goal"], "synthetic": {}}
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def _run_once(scenario: str, index: int, opts: Dict[str, Any]) -> Dict[str, Any]:
+    """One end-to-end run, in a fresh worker process."""
+    import orchestrator
+    from core.config import load_agents_cfg, load_policies_cfg
+    from core.tracing import get_tracer
+
+    spec = scenario_goal(scenario)
+    policies = copy.deepcopy(load_policies_cfg())
+    policies["llm_backend"] = {
+        "type": "mock",
+        "responses": "synthetic",
+        "synthetic": dict(spec["synthetic"], dependencies=opts["dependencies"], fail_rate=opts["fail_rate"]),
+        "latency": dict(opts["latency"], seed=opts["seed"] + index),
+    }
+    policies["llm_cache"] = {"mode": "off"}
+    policies["tracing"] = {"summary": False, "prometheus": None}
+    policies["max_parallel_tasks"] = opts["max_parallel"]
+    policies["async_pipeline"] = opts["async"]
+    policies["speculative_coding"] = opts["speculative"]
+    policies["fix_candidates"] = opts["fix_candidates"]
+
+    agents_cfg = copy.deepcopy(load_agents_cfg())
+    agents_cfg["coder"]["stream"] = opts["stream"]
+
+    root = pathlib.Path(tempfile.mkdtemp(prefix="agent0-bench-"))
+    workspace = root / "workspace"
+    workspace.mkdir()
+    # Logs and state stay out of the repository's runs/
+    orchestrator.RUNS_DIR = root / "runs"
+    run_id = f"bench-{scenario.replace(':', '')}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{index}"
+    if opts["tracemalloc"]:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        status = orchestrator.run(goal=spec["goal"], workspace=workspace, run_id=run_id,
+                                  policies=policies, agents_cfg=agents_cfg, run_tests=opts["run_tests"])
+    finally:
+        wall = time.perf_counter() - start
+        if not opts["keep"]:
+            shutil.rmtree(root, ignore_errors=True)
+    heap_peak = tracemalloc.get_traced_memory()[1] if opts["tracemalloc"] else None
+    durations: Dict[str, List[float]] = {}
+    for s in get_tracer().spans:
+        durations.setdefault(s.name, []).append(s.duration_ms)
+    llm = get_tracer().aggregate().get("llm.call", {})
+    return {
+        "scenario": scenario,
+        "run_id": run_id,
+        "wall_s": wall,
+        "tasks": len(status),
+        "passed": sum(1 for v in status.values() if v == "passed"),
+        "llm_calls": len(durations.get("llm.call", [])),
+        "prompt_tokens": llm.get("prompt_tokens", 0),
+        "cached_tokens": llm.get("cached_tokens", 0),
+        "durations_ms": durations,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "peak_heap_mb": heap_peak / (1024 * 1024) if heap_peak is not None else None,
+    }
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-scenario aggregate over repeated runs."""
+    walls = [r["wall_s"] for r in runs]
+    tasks = sum(r["passed"] for r in runs)
+    phases: Dict[str, List[float]] = {}
+    for r in runs:
+        for name, values in r["durations_ms"].items():
+            phases.setdefault(name, []).extend(values)
+    return {
+        "runs": len(runs),
+        "wall_p50_s": _percentile(walls, 0.5),
+        "wall_max_s": max(walls),
+        "tasks_per_s": tasks / sum(walls) if sum(walls) else 0.0,
+        "llm_calls_per_s": sum(r["llm_calls"] for r in runs) / sum(walls) if sum(walls) else 0.0,
+        "passed": f"{tasks}/{sum(r['tasks'] for r in runs)}",
+        # Share of prompt tokens served from the (simulated) provider prompt cache
+        "cached_input": sum(r["cached_tokens"] for r in runs) / max(1, sum(r["prompt_tokens"] for r in runs)),
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+        "peak_heap_mb": max((r["peak_heap_mb"] or 0.0) for r in runs) if runs[0]["peak_heap_mb"] is not None else None,
+        "phases": {name: {"count": len(v), "p50_ms": _percentile(v, 0.5), "p99_ms": _percentile(v, 0.99),
+                          "total_ms": sum(v)} for name, v in phases.items()},
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = []
+    for scenario, st in report["scenarios"].items():
+        heap = f", heap peak {st['peak_heap_mb']:.1f} MiB" if st["peak_heap_mb"] is not None else ""
+        lines.append(f"== {scenario}: {st['runs']} run(s), wall p50 {st['wall_p50_s']:.2f}s, "
+                     f"{st['tasks_per_s']:.2f} tasks/s, {st['llm_calls_per_s']:.2f} LLM calls/s, "
+                     f"passed {st['passed']}, cached input {100 * st['cached_input']:.0f}%, "
+                     f"peak RSS {st['peak_rss_mb']:.1f} MiB{heap}")
+        lines.append(f"   {'phase':<22}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}{'total s':>10}")
+        for name, ph in sorted(st["phases"].items(), key=lambda kv: -kv[1]["total_ms"]):
+            lines.append(f"   {name:<22}{ph['count']:>7}{ph['p50_ms']:>10.1f}{ph['p99_ms']:>10.1f}"
+                         f"{ph['total_ms'] / 1000:>10.2f}")
+    return "\n".join(lines)
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Scenarios whose p50 wall time regressed by more than tolerance (fraction) against baseline."""
+    regressions = []
+    for scenario, st in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base and base["wall_p50_s"] > 0 and st["wall_p50_s"] > base["wall_p50_s"] * (1 + tolerance):
+            regressions.append(f"{scenario}: wall p50 {base['wall_p50_s']:.2f}s -> {st['wall_p50_s']:.2f}s")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a mock LLM backend.")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS,
+                        help="comma-separated example names and/or synthetic:N")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", default="fixed:0", help="mock latency, e.g. lognormal:800:0.6")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-parallel", type=int, default=1, help="max_parallel_tasks")
+    parser.add_argument("--async", dest="async_", action="store_true", help="use the asyncio pipeline")
+    parser.add_argument("--speculative", action="store_true", help="enable speculative_coding")
+    parser.add_argument("--stream", action="store_true", help="stream coder completions")
+    parser.add_argument("--fix-candidates", type=int, default=1, help="parallel fix candidates per retry")
+    parser.add_argument("--dependencies", choices=["none", "chain"], default="none")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of tasks failing their first attempt")
+    parser.add_argument("--no-tests", action="store_true", help="skip the test/retry loop")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary workspaces, logs and state")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 wall-time regression")
+    args = parser.parse_args(argv)
+
+    opts = {
+        "latency": parse_latency(args.latency),
+        "seed": args.seed,
+        "max_parallel": args.max_parallel,
+        "async": args.async_,
+        "speculative": args.speculative,
+        "fix_candidates": args.fix_candidates,
+        "stream": args.stream,
+        "dependencies": args.dependencies,
+        "fail_rate": args.fail_rate,
+        "run_tests": not args.no_tests,
+        "tracemalloc": args.tracemalloc,
+        "keep": args.keep,
+    }
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for s in scenarios:
+        scenario_goal(s)  # fail fast on unknown names
+
+    report = {"created": datetime.utcnow().isoformat() + "Z", "options": dict(opts, scenarios=scenarios),
+              "scenarios": {}}
+    # A fresh process per run: isolates module state and makes peak RSS per run
+    ctx = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        runs = []
+        for i in range(args.repeat):
+            with ctx.Pool(1) as pool:
+                runs.append(pool.apply(_run_once, (scenario, i, opts)))
+        report["scenarios"][scenario] = summarize(runs)
+
+    print(format_report(report))
+    if args.out:
+        out = pathlib.Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Report: {out}")
+    if args.baseline:
+        baseline = json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# core/candidates.py
+"""
+Best-of-N fix attempts: instead of one fix per retry, a failing task gets N candidate
+fixes at once. Each candidate is proposed against, written to and tested in its own
+overlay (a checkout of the current workspace snapshot in a scratch directory), so
+candidates never see each other's edits. The first candidate that passes, else the
+one with the fewest failing tests, is promoted into the workspace.
+
+Candidates run the full suite, so they are only compared against a full-suite result
+for the current files; when the round starts from a selected-tests result (incremental
+tests), that baseline runs in the workspace alongside the candidates.
+"""
+import contextvars
+import pathlib
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Dict, Any, List, Optional, Tuple
+from agents.tester import count_failures
+from core.snapshot import get_store
+from core.tracing import span, annotate
+from core.workspace import ensure_in_workspace, ensure_package_structure, write_files
+
+# How long run() waits for abandoned candidates to notice and stop (an LLM call in
+# flight cannot be interrupted)
+ABANDON_WAIT_SECONDS = 30.0
+
+class _Abandoned(Exception):
+    """Raised inside a candidate once another one has won the round."""
+
+# Prompt variants, one per candidate after the first (which gets the plain fix prompt)
+DEFAULT_HINTS = [
+    "Make the smallest change that fixes the reported failures.",
+    "Find the root cause first (edge cases, interface or signature mismatches) and fix that, "
+    "rewriting the affected functions if needed.",
+    "Re-read the task and the failing assertions; check whether the tests or the implementation "
+    "misread the specification, and fix whichever is wrong.",
+]
+
+def _narrowed(test_res: Dict[str, Any]) -> bool:
+    """True for a result of the selected tests only (see TesterAgent.test, changed=)."""
+    return test_res.get("selected_tests") is not None
+
+class BestOfN:
+    def __init__(self, coder, tester, workspace_path: pathlib.Path, n: int, hints: List[str] = None,
+                 project_root: str = None, test_folder_root: str = None, log_func=None):
+        self.coder = coder
+        self.tester = tester
+        self.workspace_path = workspace_path
+        self.n = n
+        self.hints = list(hints or DEFAULT_HINTS)
+        self.project_root = project_root
+        self.test_folder_root = test_folder_root
+        self.log_func = log_func
+        self.store = get_store(workspace_path)
+
+    def _variant(self, fix_task: Dict[str, Any], i: int) -> Dict[str, Any]:
+        """The task sent for candidate i; distinct payloads also keep the LLM cache from answering all alike."""
+        task = dict(fix_task)
+        if i > 0:
+            task["approach"] = self.hints[(i - 1) % len(self.hints)]
+            task["candidate"] = i
+        return task
+
+    def _overlay(self, snap: str) -> pathlib.Path:
+        # Next to the blobs, so the checkout can hard-link them
+        parent = (self.store.root / "overlays").resolve()
+        parent.mkdir(parents=True, exist_ok=True)
+        overlay = pathlib.Path(tempfile.mkdtemp(prefix="candidate-", dir=parent))
+        self.store.checkout(snap, overlay, link=True)
+        return overlay
+
+    def _result(self, i: int, task: Dict[str, Any], overlay: pathlib.Path, edits: List[str],
+                test_res: Dict[str, Any]) -> Dict[str, Any]:
+        failures = count_failures(test_res)
+        annotate(failures=failures)
+        self.log_func("orchestrator", "candidate_tested", {"task_id": task["id"], "candidate": i,
+                                                           "approach": task.get("approach"),
+                                                           "failures": failures, "files": edits})
+        return {"index": i, "edits": edits, "test": test_res, "failures": failures,
+                "files": {rel: (overlay / rel).read_bytes() for rel in edits}}
+
+    def _baseline(self, t: Dict[str, Any]) -> Dict[str, Any]:
+        """Full-suite result for the current workspace files."""
+        with span("candidates.baseline", task_id=t.get("id", "")):
+            return self.tester.test(t, self.workspace_path, self.project_root, self.test_folder_root,
+                                    log_func=self.log_func)
+
+    async def _abaseline(self, t: Dict[str, Any]) -> Dict[str, Any]:
+        with span("candidates.baseline", task_id=t.get("id", "")):
+            return await self.tester.atest(t, self.workspace_path, self.project_root, self.test_folder_root,
+                                           log_func=self.log_func)
+
+    @staticmethod
+    def _check(stop: Optional[threading.Event]) -> None:
+        if stop is not None and stop.is_set():
+            annotate(abandoned=True)
+            raise _Abandoned()
+
+    def _candidate(self, i: int, t: Dict[str, Any], fix_task: Dict[str, Any], feedback: str,
+                   snap: str, stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+        task = self._variant(fix_task, i)
+        overlay = self._overlay(snap)
+        try:
+            with span("candidate", task_id=t.get("id", ""), candidate=i):
+                proposal = self.coder.propose(task, overlay, feedback, self.project_root, self.log_func)
+                # The round may have been decided during the model call
+                self._check(stop)
+                edits = self.coder.commit(proposal, overlay, self.project_root, self.log_func)["edits"]
+                self._check(stop)
+                # Full suite, in a fresh interpreter: the warm worker is bound to the real workspace
+                test_res = self.tester.test(t, overlay, self.project_root, self.test_folder_root,
+                                            log_func=self.log_func, isolated=True)
+                return self._result(i, task, overlay, edits, test_res)
+        finally:
+            shutil.rmtree(overlay, ignore_errors=True)
+
+    async def _acandidate(self, i: int, t: Dict[str, Any], fix_task: Dict[str, Any], feedback: str,
+                          snap: str) -> Dict[str, Any]:
+        task = self._variant(fix_task, i)
+        overlay = self._overlay(snap)
+        try:
+            with span("candidate", task_id=t.get("id", ""), candidate=i):
+                proposal = await self.coder.apropose(task, overlay, feedback, self.project_root, self.log_func)
+                edits = self.coder.commit(proposal, overlay, self.project_root, self.log_func)["edits"]
+                test_res = await self.tester.atest(t, overlay, self.project_root, self.test_folder_root,
+                                                   log_func=self.log_func, isolated=True)
+                return self._result(i, task, overlay, edits, test_res)
+        finally:
+            shutil.rmtree(overlay, ignore_errors=True)
+
+    def run(self, t: Dict[str, Any], fix_task: Dict[str, Any], feedback: str,
+            test_res: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        One round of N candidates. Returns (edits written to the workspace, test result).
+        Candidates still running when one passes are abandoned: they stop at their next
+        check (after the model call, before testing) and are waited for, up to
+        ABANDON_WAIT_SECONDS, before the winner is returned.
+        """
+        with span("candidates", task_id=t.get("id", ""), n=self.n):
+            snap = self.store.snapshot()
+            stop = threading.Event()
+            pool = ThreadPoolExecutor(max_workers=self.n + 1, thread_name_prefix="fix-candidate")
+            futures = [pool.submit(contextvars.copy_context().run, self._candidate, i, t, fix_task, feedback,
+                                   snap, stop)
+                       for i in range(self.n)]
+            baseline = (pool.submit(contextvars.copy_context().run, self._baseline, t)
+                        if _narrowed(test_res) else None)
+            results, errors = [], []
+            try:
+                for fut in as_completed(futures):
+                    try:
+                        res = fut.result()
+                    except Exception as e:
+                        errors.append(self._failed(t, futures.index(fut), e))
+                        continue
+                    results.append(res)
+                    if res["failures"] == 0:
+                        break
+                if baseline is not None:
+                    # Waited for even when a candidate passed: it must not run while one is promoted
+                    test_res = baseline.result()
+            finally:
+                stop.set()
+                pool.shutdown(wait=False, cancel_futures=True)
+                wait(futures, timeout=ABANDON_WAIT_SECONDS)
+            return self._select(t, results, errors, test_res)
+
+    async def arun(self, t: Dict[str, Any], fix_task: Dict[str, Any], feedback: str,
+                   test_res: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
+        """asyncio version of run; losing candidates are cancelled once one passes."""
+        import asyncio
+        with span("candidates", task_id=t.get("id", ""), n=self.n):
+            snap = self.store.snapshot()
+            tasks = [asyncio.ensure_future(self._acandidate(i, t, fix_task, feedback, snap)) for i in range(self.n)]
+            baseline = asyncio.ensure_future(self._abaseline(t)) if _narrowed(test_res) else None
+            results, errors = [], []
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    try:
+                        res = await fut
+                    except Exception as e:
+                        errors.append(self._failed(t, None, e))
+                        continue
+                    results.append(res)
+                    if res["failures"] == 0:
+                        break
+                if baseline is not None:
+                    test_res = await baseline
+            finally:
+                for task in tasks:
+                    task.cancel()
+                if baseline is not None:
+                    baseline.cancel()
+                await asyncio.gather(*tasks, *([baseline] if baseline is not None else []), return_exceptions=True)
+            return self._select(t, results, errors, test_res)
+
+    def _failed(self, t: Dict[str, Any], i: Optional[int], e: Exception) -> Exception:
+        self.log_func("orchestrator", "candidate_error", {"task_id": t["id"], "candidate": i,
+                                                          "error": f"{type(e).__name__}: {e}"})
+        return e
+
+    def _select(self, t: Dict[str, Any], results: List[Dict[str, Any]], errors: List[Exception],
+                test_res: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
+        """test_res is the full-suite result for the current files, as the candidates' results."""
+        if not results:
+            raise errors[0]
+        best = min(results, key=lambda r: (r["failures"], r["index"]))
+        current = count_failures(test_res)
+        annotate(winner=best["index"], failures=best["failures"])
+        if best["failures"] > current or best["failures"] == float("inf"):
+            self.log_func("orchestrator", "candidates_rejected", {"task_id": t["id"], "failures": current,
+                                                                  "best_failures": best["failures"]})
+            note = (f"None of {len(results)} candidate fixes reduced the failing tests "
+                    f"(best: {best['failures']}, current: {current}); the files are unchanged.\n\n")
+            return [], dict(test_res, report=note + test_res.get("report", ""))
+        self._promote(t, best)
+        return best["edits"], best["test"]
+
+    def _promote(self, t: Dict[str, Any], best: Dict[str, Any]) -> None:
+        write_files({ensure_in_workspace(rel, self.workspace_path): data for rel, data in best["files"].items()})
+        if self.project_root:
+            ensure_package_structure(self.project_root, self.workspace_path)
+        self.log_func("orchestrator", "candidate_promoted", {"task_id": t["id"], "candidate": best["index"],
+                                                             "failures": best["failures"], "files": best["edits"]})
@@ -1,21 +1,56 @@
 # core/config.py
-import yaml
-import pathlib
-from typing import Dict, Any
+"""
+Config and prompt loading. Files are parsed once and cached per path, keyed by
+(mtime, size), so repeated loads (every agent, every run in a process) cost a
+stat() and edits on disk are still picked up. YAML results are returned as
+copies: callers may modify them.
+"""
+import copy
+import os
+import threading
+from typing import Dict, Any, Callable, Tuple
+
+# (kind, path) -> ((mtime_ns, size), parsed value)
+_CACHE: Dict[Tuple[str, str], Tuple[Tuple[int, int], Any]] = {}
+_LOCK = threading.Lock()
+
+def _cached(path: str, kind: str, parse: Callable[[str], Any]) -> Any:
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _LOCK:
+        hit = _CACHE.get((kind, path))
+    if hit and hit[0] == stamp:
+        return hit[1]
+    with open(path, "r", encoding="utf-8") as f:
+        value = parse(f.read())
+    with _LOCK:
+        _CACHE[(kind, path)] = (stamp, value)
+    return value
+
+def _parse_yaml(text: str) -> Any:
+    import yaml  # only needed once per file
+    return yaml.safe_load(text)
+
+def load_yaml(path: str) -> Any:
+    return copy.deepcopy(_cached(str(path), "yaml", _parse_yaml))
+
+def load_text(path: str) -> str:
+    """A prompt or other text file (cached like the YAML configs)."""
+    return _cached(str(path), "text", lambda text: text)
 
 def load_agents_cfg() -> Dict[str, Any]:
-    cfg = yaml.safe_load(open("config/agents.yaml", "r", encoding="utf-8"))
+    cfg = load_yaml("config/agents.yaml")
     # Support both {planner:...} and {agents:{planner:...}}
     return cfg.get("agents", cfg)
 
 def load_policies_cfg() -> Dict[str, Any]:
-    if not pathlib.Path("config/policies.yaml").exists():
+    if not os.path.exists("config/policies.yaml"):
         return {"max_task_retries": 3, "timeouts": {"per_agent_seconds": 60, "global_seconds": 300},
                 "file_access": {"restrict_to_workspace": True, "allow_paths": ["workspace/"]}}
-    return yaml.safe_load(open("config/policies.yaml", "r", encoding="utf-8"))
+    return load_yaml("config/policies.yaml")
 
 def load_tasks_cfg() -> Dict[str, Any]:
-    return yaml.safe_load(open("config/tasks.yaml", "r", encoding="utf-8"))
+    return load_yaml("config/tasks.yaml")
 
 def agent_conf(agents: Dict[str, Any], role: str) -> Dict[str, Any]:
     if role not in agents:
@@ -0,0 +1,120 @@
+# core/context.py
+"""
+Token-budgeted context packing for coder prompts: rank context files, trim large
+Python files down to the symbols that matter (those in failing tracebacks first),
+and compact test feedback.
+"""
+import ast
+import re
+from typing import Dict, Any, List, Optional, Set
+
+# File "pkg/mod.py", line 12, in f   |   pkg/mod.py:12: AssertionError
+_TB_PATTERNS = [
+    re.compile(r'File "([^"]+)", line (\d+)'),
+    re.compile(r'^([\w./\\-]+\.py):(\d+):', re.MULTILINE),
+]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough for budgeting."""
+    return len(text) // 4 + 1
+
+def traceback_lines(feedback: str, paths: List[str]) -> Dict[str, Set[int]]:
+    """Line numbers referenced by tracebacks in feedback, keyed by the matching context path."""
+    hits: Dict[str, Set[int]] = {}
+    if not feedback:
+        return hits
+    for pattern in _TB_PATTERNS:
+        for m in pattern.finditer(feedback):
+            ref = m.group(1).replace("\\", "/")
+            for rel in paths:
+                if ref == rel or ref.endswith("/" + rel):
+                    hits.setdefault(rel, set()).add(int(m.group(2)))
+    return hits
+
+def compact_feedback(feedback: str, max_tokens: int) -> str:
+    """
+    Drop repeated blocks (identical failure sections are common when many tests hit
+    the same bug), then keep head and tail within the budget.
+    """
+    if not feedback:
+        return feedback
+    seen = set()
+    blocks = []
+    for block in re.split(r"\n\s*\n", feedback):
+        key = block.strip()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        blocks.append(block)
+    text = "\n\n".join(blocks)
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 5 // 8
+    tail = max_chars - head - 5
+    return text[:head] + "\n...\n" + text[-tail:]
+
+def extract_symbols(content: str, hot_lines: Set[int]) -> str:
+    """
+    Keep module-level statements, full bodies of top-level defs/classes containing a
+    hot line, and only the signature of everything else. Kept lines are copied verbatim.
+    """
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return content
+    lines = content.splitlines(keepends=True)
+    out: List[str] = []
+    pos = 0  # next line index not yet emitted
+    for node in tree.body:
+        start = (node.decorator_list[0].lineno if getattr(node, "decorator_list", None) else node.lineno) - 1
+        end = node.end_lineno
+        out.extend(lines[pos:start])
+        pos = end
+        is_def = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        if not is_def or any(start < ln <= end for ln in hot_lines):
+            out.extend(lines[start:end])
+            continue
+        body_start = node.body[0].lineno - 1
+        # For classes, keep method signatures so the coder sees the interface
+        out.extend(lines[start:body_start])
+        indent = re.match(r"\s*", lines[body_start]).group(0)
+        if isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    sig_start = (item.decorator_list[0].lineno if item.decorator_list else item.lineno) - 1
+                    out.extend(lines[sig_start:item.body[0].lineno - 1])
+                    out.append(f"{indent}    ...\n")
+        out.append(f"{indent}... # {end - body_start} lines omitted\n")
+    out.extend(lines[pos:])
+    return "".join(out)
+
+def pack_context(files: List[Dict[str, Any]], max_tokens: int, feedback: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Fit context files into max_tokens. Files named in tracebacks go first. Files that
+    don't fit whole are trimmed (Python: symbol extraction; other text: head) and
+    marked "partial": true; files that don't fit at all keep only their path.
+    Output order follows the input order.
+    """
+    hits = traceback_lines(feedback or "", [f["path"] for f in files])
+    order = sorted(range(len(files)), key=lambda i: (files[i]["path"] not in hits, i))
+    used = 0
+    packed: Dict[int, Dict[str, Any]] = {}
+    for i in order:
+        f = files[i]
+        content = f["content"]
+        cost = estimate_tokens(content)
+        if used + cost <= max_tokens:
+            packed[i] = {"path": f["path"], "content": content}
+            used += cost
+            continue
+        trimmed = extract_symbols(content, hits.get(f["path"], set())) if f["path"].endswith(".py") else content
+        remaining = max(0, max_tokens - used)
+        if estimate_tokens(trimmed) > remaining:
+            keep = trimmed[:remaining * 4]
+            trimmed = keep[:keep.rfind("\n") + 1] if "\n" in keep else ""
+        if trimmed:
+            trimmed += f"# ... (partial view of {len(content.splitlines())} lines)\n"
+        packed[i] = {"path": f["path"], "partial": True, "content": trimmed}
+        used += estimate_tokens(trimmed)
+    return [packed[i] for i in range(len(files))]
@@ -1,27 +1,277 @@
 # core/execution.py
+"""
+Sandboxed command execution for the agents. Every allowlisted command takes a slot
+from a bounded pool (max_concurrent runs per process, sync and async callers alike),
+runs under resource limits (CPU seconds, address space, open files; see
+test_worker.resolve_limits) in its own process group, and has its stdout / stderr
+streamed into ring buffers that keep only the last max_output_bytes each. So
+concurrent test runs on one host use bounded memory whatever the tests print.
+allow_exec / allow_exec_async keep the subprocess.run contract: CompletedProcess
+with text output, TimeoutExpired on timeout.
+"""
+import os
+import signal
 import subprocess
-from typing import List, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from core import test_worker
+from core.tracing import span, annotate
+
+ALLOWED_PREFIXES = [
+    ("pytest", "-q"),
+    ("pytest",),
+    ("python", "-m", "pip", "install"),
+    ("python", "-c"),  # Allow python -c commands for import testing
+]
+
+# See the `execution` section of policies.yaml
+_EXEC_CFG: Dict[str, Any] = {
+    "warm_worker": False,
+    "max_concurrent": os.cpu_count() or 4,
+    "max_output_bytes": 1024 * 1024,
+    "limits": {"cpu_seconds": 300, "memory_mb": 4096, "open_files": 1024},
+}
+
+_READ_CHUNK = 64 * 1024
+
+class RingBuffer:
+    """Keeps the last max_bytes written to it (everything when max_bytes is falsy)."""
+
+    def __init__(self, max_bytes: Optional[int]):
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.dropped = 0
+        self._buf = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self._buf += data
+        excess = len(self._buf) - self.max_bytes if self.max_bytes else 0
+        if excess > 0:
+            del self._buf[:excess]
+            self.dropped += excess
+
+    def text(self) -> str:
+        text = self._buf.decode("utf-8", errors="replace")
+        return test_worker.TRUNCATED_NOTE.format(self.dropped) + text if self.dropped else text
+
+class Executor:
+    """Bounded pool of sandboxed command runs; configured from the `execution` policy section."""
+
+    def __init__(self, max_concurrent: int, limits: Optional[Dict[str, Optional[int]]] = None,
+                 max_output_bytes: Optional[int] = None):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.limits = {k: v for k, v in (limits or {}).items() if v} or None
+        self.max_output_bytes = max_output_bytes
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    def _popen_kwargs(self) -> Dict[str, Any]:
+        if os.name != "posix":
+            return {}  # no rlimits or process groups; the pool and output caps still apply
+        return {"start_new_session": True, "preexec_fn": self._preexec()}
+
+    def _preexec(self):
+        # Resolved here: the child of a threaded parent should do nothing but setrlimit
+        rlimits = test_worker.resolve_limits(self.limits)
+        if not rlimits:
+            return None
+        import resource
+        setrlimit = resource.setrlimit
+
+        def preexec() -> None:
+            for res, soft, hard in rlimits:
+                setrlimit(res, (soft, hard))
+        return preexec
+
+    @contextmanager
+    def slot(self):
+        start = time.perf_counter()
+        with self._slots:
+            annotate(queue_ms=(time.perf_counter() - start) * 1000.0)
+            yield
+
+    async def aslot(self) -> None:
+        """Take a slot without blocking the event loop; release with self.release()."""
+        import asyncio
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            waiter = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+            try:
+                await asyncio.shield(waiter)
+            except asyncio.CancelledError:
+                # The thread still gets the slot eventually: hand it back then
+                waiter.add_done_callback(lambda f: None if f.cancelled() or f.exception() else self.release())
+                raise
+        annotate(queue_ms=(time.perf_counter() - start) * 1000.0)
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def _result(self, cmd: List[str], returncode: int, out: RingBuffer,
+                err: RingBuffer) -> subprocess.CompletedProcess:
+        annotate(exit_code=returncode, output_dropped=out.dropped + err.dropped)
+        return subprocess.CompletedProcess(cmd, returncode, out.text(), err.text())
+
+    @staticmethod
+    def _kill(proc) -> None:
+        """Kill the command and anything it started (its process group on POSIX)."""
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def run(self, cmd: List[str], cwd: str, timeout: float) -> subprocess.CompletedProcess:
+        """A cold subprocess under the limits (the caller holds a slot)."""
+        proc = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, **self._popen_kwargs())
+        out, err = RingBuffer(self.max_output_bytes), RingBuffer(self.max_output_bytes)
+
+        def pump(pipe, buf: RingBuffer) -> None:
+            with pipe:
+                for chunk in iter(lambda: pipe.read1(_READ_CHUNK), b""):
+                    buf.write(chunk)
+
+        readers = [threading.Thread(target=pump, args=(proc.stdout, out), daemon=True),
+                   threading.Thread(target=pump, args=(proc.stderr, err), daemon=True)]
+        deadline = time.monotonic() + timeout
+        for t in readers:
+            t.start()
+        try:
+            proc.wait(timeout=timeout)
+            # A background child can hold the pipes open after the command exits
+            for t in readers:
+                t.join(max(0.0, deadline - time.monotonic()))
+            if any(t.is_alive() for t in readers):
+                raise subprocess.TimeoutExpired(cmd, timeout)
+        except subprocess.TimeoutExpired:
+            self._kill(proc)
+            proc.wait()
+            for t in readers:
+                t.join()
+            raise subprocess.TimeoutExpired(cmd, timeout, output=out.text(), stderr=err.text())
+        except BaseException:
+            self._kill(proc)
+            proc.wait()
+            raise
+        return self._result(cmd, proc.returncode, out, err)
+
+    async def arun(self, cmd: List[str], cwd: str, timeout: float) -> subprocess.CompletedProcess:
+        """asyncio version of run; cancelling the caller kills the command."""
+        import asyncio
+        proc = await asyncio.create_subprocess_exec(*cmd, cwd=cwd, stdin=subprocess.DEVNULL,
+                                                    stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.PIPE, **self._popen_kwargs())
+        out, err = RingBuffer(self.max_output_bytes), RingBuffer(self.max_output_bytes)
+
+        async def pump(stream, buf: RingBuffer) -> None:
+            while True:
+                chunk = await stream.read(_READ_CHUNK)
+                if not chunk:
+                    return
+                buf.write(chunk)
+
+        readers = asyncio.gather(pump(proc.stdout, out), pump(proc.stderr, err))
+        deadline = time.monotonic() + timeout
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=timeout)
+            # A background child can hold the pipes open after the command exits
+            await asyncio.wait_for(asyncio.shield(readers), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._kill(proc)
+            await proc.wait()
+            await readers
+            raise subprocess.TimeoutExpired(cmd, timeout, output=out.text(), stderr=err.text())
+        finally:
+            if proc.returncode is None or not readers.done():
+                self._kill(proc)
+                await proc.wait()
+            # The pipes close once the process group is gone
+            await readers
+        return self._result(cmd, proc.returncode, out, err)
+
+def _executor_from_cfg(cfg: Dict[str, Any]) -> Executor:
+    return Executor(cfg.get("max_concurrent") or os.cpu_count() or 4, cfg.get("limits"), cfg.get("max_output_bytes"))
+
+_EXECUTOR = _executor_from_cfg(_EXEC_CFG)
+
+def configure_execution(cfg: Optional[Dict[str, Any]]) -> Executor:
+    global _EXECUTOR
+    _EXEC_CFG.update(cfg or {})
+    _EXECUTOR = _executor_from_cfg(_EXEC_CFG)
+    return _EXECUTOR
 
 def is_prefix(cmd: List[str], prefix: Tuple[str, ...]) -> bool:
     return tuple(cmd[:len(prefix)]) == prefix
 
-def allow_exec(cmd: List[str], workspace_path: str, timeout: int = 60) -> subprocess.CompletedProcess:
+def check_allowed(cmd: List[str]) -> None:
     """
     Minimal allowlist for subprocess. Extend when needed.
     """
-    allowed_prefixes = [
-        ("pytest", "-q"),
-        ("pytest",),
-        ("python", "-m", "pip", "install"),
-        ("python", "-c"),  # Allow python -c commands for import testing
-    ]
-    if not any(is_prefix(cmd, p) for p in allowed_prefixes):
+    if not any(is_prefix(cmd, p) for p in ALLOWED_PREFIXES):
         raise RuntimeError(f"Blocked command: {cmd}")
 
-    return subprocess.run(
-        cmd,
-        cwd=workspace_path,
-        capture_output=True,
-        text=True,
-        timeout=timeout
-    )
+def _use_warm(cmd: List[str], isolated: bool) -> bool:
+    return bool(_EXEC_CFG.get("warm_worker")) and not isolated and test_worker.supported(cmd)
+
+def _run_warm(executor: Executor, cmd: List[str], workspace_path: str,
+              timeout: int) -> Optional[subprocess.CompletedProcess]:
+    """The command on the workspace's warm worker; None when the worker is unavailable."""
+    try:
+        proc = test_worker.get_worker(workspace_path).run(cmd, timeout=timeout, limits=executor.limits,
+                                                          max_output_bytes=executor.max_output_bytes)
+    except RuntimeError as e:
+        print(f"Warm test worker unavailable ({e}); falling back to subprocess")
+        return None
+    annotate(warm=True, exit_code=proc.returncode)
+    return proc
+
+def allow_exec(cmd: List[str], workspace_path: str, timeout: int = 60,
+               isolated: bool = False) -> subprocess.CompletedProcess:
+    """
+    Run an allowlisted command in the workspace. pytest and `python -c` go to the
+    warm per-workspace worker when enabled; isolated=True always uses a cold subprocess.
+    """
+    check_allowed(cmd)
+    executor = _EXECUTOR
+    with span("exec", cmd=" ".join(cmd[:2])), executor.slot():
+        if _use_warm(cmd, isolated):
+            proc = _run_warm(executor, cmd, workspace_path, timeout)
+            if proc is not None:
+                return proc
+        annotate(warm=False)
+        return executor.run(cmd, workspace_path, timeout)
+
+async def allow_exec_async(cmd: List[str], workspace_path: str, timeout: int = 60,
+                           isolated: bool = False) -> subprocess.CompletedProcess:
+    """
+    Non-blocking allow_exec: same allowlist, limits, timeout, warm worker routing
+    and CompletedProcess contract.
+    """
+    import asyncio
+    check_allowed(cmd)
+    executor = _EXECUTOR
+    with span("exec", cmd=" ".join(cmd[:2])):
+        await executor.aslot()
+        release = True
+        try:
+            if _use_warm(cmd, isolated):
+                # The worker call blocks, so it runs in a thread; the worker's own
+                # timeout bounds it
+                warm = asyncio.ensure_future(asyncio.to_thread(_run_warm, executor, cmd, workspace_path, timeout))
+                try:
+                    proc = await asyncio.shield(warm)
+                except asyncio.CancelledError:
+                    # The run cannot be interrupted: keep the slot until it finishes
+                    release = False
+                    warm.add_done_callback(lambda f: executor.release())
+                    raise
+                if proc is not None:
+                    return proc
+            annotate(warm=False)
+            return await executor.arun(cmd, workspace_path, timeout)
+        finally:
+            if release:
+                executor.release()
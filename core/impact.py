@@ -0,0 +1,133 @@
+# core/impact.py
+"""
+Test impact analysis: which test files can observe a change to a given set of files.
+"""
+import ast
+import os
+import pathlib
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from core.index import IGNORE_DIRS
+
+def is_test_file(rel: str) -> bool:
+    name = rel.rsplit("/", 1)[-1]
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+def _module_name(rel: str) -> str:
+    parts = rel[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+def _parse_imports(path: pathlib.Path, module: str, is_pkg: bool) -> Set[str]:
+    """Absolute dotted names referenced by the file's imports (relative imports resolved)."""
+    try:
+        tree = ast.parse(path.read_bytes())
+    except (OSError, SyntaxError, ValueError):
+        return set()
+    package = module if is_pkg else module.rpartition(".")[0]
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parts = package.split(".") if package else []
+                parts = parts[:len(parts) - (node.level - 1)] if node.level > 1 else parts
+                base = ".".join(p for p in parts + ([node.module] if node.module else []) if p)
+            if base:
+                found.add(base)
+            found.update(f"{base}.{a.name}" if base else a.name for a in node.names)
+    return found
+
+class ImportGraph:
+    """
+    Import graph of a workspace's .py files. refresh() re-parses only files whose
+    mtime or size changed, so repeated queries during a run are cheap.
+    """
+
+    def __init__(self, workspace_path: pathlib.Path):
+        self.workspace_path = pathlib.Path(workspace_path)
+        self._files: Dict[str, Tuple[int, int, Set[str]]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        seen = set()
+        for root, dirs, files in os.walk(self.workspace_path):
+            dirs[:] = [d for d in dirs if d not in IGNORE_DIRS and not d.startswith(".")]
+            for name in files:
+                if not name.endswith(".py"):
+                    continue
+                p = pathlib.Path(root) / name
+                rel = p.relative_to(self.workspace_path).as_posix()
+                seen.add(rel)
+                st = p.stat()
+                cached = self._files.get(rel)
+                if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                    continue
+                module = _module_name(rel)
+                imports = _parse_imports(p, module, name == "__init__.py")
+                # Importing a module first runs its parent packages' __init__.py
+                parents = module.split(".")[:-1]
+                imports.update(".".join(parents[:i]) for i in range(1, len(parents) + 1))
+                self._files[rel] = (st.st_mtime_ns, st.st_size, imports)
+        for rel in set(self._files) - seen:
+            del self._files[rel]
+
+    def _resolver(self) -> Dict[str, Set[str]]:
+        """Dotted name -> files. Every suffix of a path is registered, so imports relative to a source root resolve too."""
+        names: Dict[str, Set[str]] = {}
+        for rel in self._files:
+            parts = _module_name(rel).split(".")
+            for i in range(len(parts)):
+                names.setdefault(".".join(parts[i:]), set()).add(rel)
+        return names
+
+    def dependents(self, changed: List[str]) -> Set[str]:
+        """All files that transitively import any of `changed` (including the changed files)."""
+        with self._lock:
+            self.refresh()
+            names = self._resolver()
+            reverse: Dict[str, Set[str]] = {}
+            for rel, (_, _, imports) in self._files.items():
+                for name in imports:
+                    # `import a.b.c` also executes a/__init__.py and a/b/__init__.py
+                    parts = name.split(".")
+                    for i in range(1, len(parts) + 1):
+                        for target in names.get(".".join(parts[:i]), ()):
+                            if target != rel:
+                                reverse.setdefault(target, set()).add(rel)
+
+        result = set(changed)
+        stack = list(changed)
+        while stack:
+            for dep in reverse.get(stack.pop(), ()):
+                if dep not in result:
+                    result.add(dep)
+                    stack.append(dep)
+        return result
+
+_GRAPHS: Dict[str, ImportGraph] = {}
+_GRAPHS_LOCK = threading.Lock()
+
+def get_graph(workspace_path: pathlib.Path) -> ImportGraph:
+    key = str(pathlib.Path(workspace_path).resolve())
+    with _GRAPHS_LOCK:
+        if key not in _GRAPHS:
+            _GRAPHS[key] = ImportGraph(pathlib.Path(key))
+        return _GRAPHS[key]
+
+def select_tests(workspace_path: pathlib.Path, changed: List[str], test_root: str) -> Optional[List[str]]:
+    """
+    Test files under test_root affected by `changed`, sorted. Returns None when the
+    change can't be analysed (conftest.py or non-Python files) and the whole suite must run.
+    """
+    if not changed:
+        return None
+    for rel in changed:
+        if not rel.endswith(".py") or rel.rsplit("/", 1)[-1] == "conftest.py":
+            return None
+    prefix = test_root.rstrip("/") + "/"
+    affected = get_graph(workspace_path).dependents(changed)
+    return sorted(rel for rel in affected if rel.startswith(prefix) and is_test_file(rel))
@@ -0,0 +1,165 @@
+# core/index.py
+"""
+Persistent workspace index: path, size, mtime, content hash and a short outline
+(top-level defs/classes, markdown headings) per file. update() only re-reads files
+whose size or mtime changed, so repo summaries stay cheap on large workspaces.
+"""
+import ast
+import fnmatch
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from typing import Dict, Any, List, Optional
+
+IGNORE_DIRS = {".git", "__pycache__", ".pytest_cache", ".venv", "venv", "node_modules", ".mypy_cache",
+               ".ruff_cache", ".tox", ".nox", ".cache", "build", "dist"}
+IGNORE_PATTERNS = ["*.pyc", "*.pyo", "*.egg-info", ".DS_Store"]
+SUMMARY_SUFFIXES = (".py", ".md", ".txt", ".json", ".yaml", ".yml", ".tex")
+MAX_OUTLINE_BYTES = 1024 * 1024
+INDEX_VERSION = 1
+
+def _outline(path: pathlib.Path, data: bytes) -> List[str]:
+    if len(data) > MAX_OUTLINE_BYTES:
+        return []
+    if path.suffix == ".py":
+        try:
+            tree = ast.parse(data)
+        except (SyntaxError, ValueError):
+            return ["<syntax error>"]
+        items = []
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                items.append(f"def {node.name}({', '.join(a.arg for a in node.args.args)})")
+            elif isinstance(node, ast.ClassDef):
+                items.append(f"class {node.name}")
+        return items
+    if path.suffix == ".md":
+        text = data.decode("utf-8", errors="replace")
+        return [line.strip() for line in text.splitlines() if line.startswith("#")][:8]
+    return []
+
+class WorkspaceIndex:
+    def __init__(self, workspace_path: pathlib.Path, cache_dir: str = ".cache/workspace_index"):
+        self.workspace_path = pathlib.Path(workspace_path).resolve()
+        key = hashlib.sha1(str(self.workspace_path).encode("utf-8")).hexdigest()[:16]
+        self.index_file = pathlib.Path(cache_dir) / f"{key}.json"
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("workspace") == str(self.workspace_path):
+            self.entries = data.get("entries", {})
+
+    def _save(self) -> None:
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": INDEX_VERSION, "workspace": str(self.workspace_path),
+                                   "entries": self.entries}), encoding="utf-8")
+        os.replace(tmp, self.index_file)
+
+    def _ignored(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pat) for pat in IGNORE_PATTERNS)
+
+    def update(self) -> Dict[str, Any]:
+        """Bring the index in line with the workspace. Returns counts of changed/removed files."""
+        with self._lock:
+            seen = set()
+            changed = 0
+            if self.workspace_path.exists():
+                for root, dirs, files in os.walk(self.workspace_path):
+                    dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS and not self._ignored(d))
+                    for name in files:
+                        if self._ignored(name):
+                            continue
+                        p = pathlib.Path(root) / name
+                        rel = p.relative_to(self.workspace_path).as_posix()
+                        try:
+                            st = p.stat()
+                        except OSError:
+                            continue
+                        seen.add(rel)
+                        entry = self.entries.get(rel)
+                        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                            continue
+                        data = p.read_bytes()
+                        self.entries[rel] = {
+                            "size": st.st_size,
+                            "mtime_ns": st.st_mtime_ns,
+                            "sha1": hashlib.sha1(data).hexdigest(),
+                            "outline": _outline(p, data),
+                        }
+                        changed += 1
+            removed = set(self.entries) - seen
+            for rel in removed:
+                del self.entries[rel]
+            if changed or removed:
+                self._save()
+            return {"files": len(self.entries), "changed": changed, "removed": len(removed)}
+
+    def ranked(self) -> List[str]:
+        """
+        Summary-relevant paths, most useful first: source before tests/docs, shallow
+        before deep, then most recently modified. Depends only on the workspace, not on
+        when it is summarized, so the planner prompt is stable between runs.
+        """
+        def score(rel: str) -> float:
+            entry = self.entries[rel]
+            name = rel.rsplit("/", 1)[-1]
+            s = 0.0
+            if rel.endswith(".py"):
+                s += 3.0 if not (name.startswith("test_") or "/tests/" in f"/{rel}") else 1.5
+            elif name.lower().startswith("readme"):
+                s += 2.5
+            else:
+                s += 1.0
+            s -= 0.3 * rel.count("/")
+            s += 0.5 if entry.get("outline") else 0.0
+            return s
+
+        paths = [rel for rel in self.entries if rel.endswith(SUMMARY_SUFFIXES)]
+        # Recently edited files are likely what the next plan builds on: mtime breaks ties
+        return sorted(paths, key=lambda rel: (-score(rel), -self.entries[rel]["mtime_ns"], rel))
+
+    def summary(self, max_files: int = 200, max_tokens: Optional[int] = None) -> str:
+        """
+        Newline-separated paths with outline notes. With max_tokens, lines are added
+        in rank order until the (approximate, 4 chars/token) budget is used up and
+        max_files is ignored; without it, the first max_files ranked paths are listed.
+        """
+        lines = []
+        used = 0
+        ranked = self.ranked()
+        for rel in (ranked if max_tokens is not None else ranked[:max_files]):
+            if max_tokens is not None and used >= max_tokens:
+                break
+            outline = self.entries[rel].get("outline") or []
+            line = f"{rel}: {'; '.join(outline)}" if outline else rel
+            cost = len(line) // 4 + 1
+            if max_tokens is not None and used + cost > max_tokens:
+                if outline and used + len(rel) // 4 + 1 <= max_tokens:
+                    line, cost = rel, len(rel) // 4 + 1
+                else:
+                    continue
+            lines.append(line)
+            used += cost
+        omitted = len(ranked) - len(lines)
+        if omitted > 0:
+            lines.append(f"... ({omitted} more files not shown)")
+        return "\n".join(lines)
+
+_INDEXES: Dict[str, WorkspaceIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+def get_index(workspace_path: pathlib.Path) -> WorkspaceIndex:
+    key = str(pathlib.Path(workspace_path).resolve())
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = WorkspaceIndex(pathlib.Path(key))
+        return _INDEXES[key]
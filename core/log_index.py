@@ -0,0 +1,244 @@
+# core/log_index.py
+"""
+SQLite index over the run logs (runs/*.log.jsonl, including rotated segments
+<run>.<n>.log.jsonl[.gz]). update() ingests only what was appended since the last
+call: each file keeps the position (pos) after its last complete line, unchanged files
+are skipped on (size, mtime), and a segment that was rotated or compressed is
+recognized by the hash of its first line and continues where the live log left off.
+
+Every event becomes one row with run_id, ts, role, type and task_id (plus span,
+model and duration_ms for trace spans) as indexed columns and the raw `data` as
+JSON, so filters and aggregates are SQL queries instead of rescans. See logquery.py.
+"""
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sqlite3
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+INDEX_PATH = pathlib.Path("runs/index.sqlite")
+LOG_DIR = pathlib.Path("runs")
+_LOG_NAME = re.compile(r"^(?P<run_id>.+?)(?:\.\d+)?\.log\.jsonl(?:\.gz)?$")
+
+# Filterable / groupable columns; anything else is reachable through data.<key>
+COLUMNS = ("run_id", "ts", "role", "type", "task_id", "span", "model", "duration_ms")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    run_id TEXT,
+    head TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    pos INTEGER
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER,
+    run_id TEXT,
+    ts TEXT,
+    role TEXT,
+    type TEXT,
+    task_id TEXT,
+    span TEXT,
+    model TEXT,
+    duration_ms REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS events_run ON events(run_id);
+CREATE INDEX IF NOT EXISTS events_type ON events(type, role);
+CREATE INDEX IF NOT EXISTS events_task ON events(task_id);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_span ON events(span, model);
+"""
+
+def run_id_of(path: pathlib.Path) -> Optional[str]:
+    m = _LOG_NAME.match(path.name)
+    return m.group("run_id") if m else None
+
+def _open(path: pathlib.Path):
+    return gzip.open(path, "rb") if path.suffix == ".gz" else path.open("rb")
+
+def _head(f) -> Optional[str]:
+    """Hash of the first complete line: identifies a log across renames."""
+    first = f.readline()
+    return hashlib.sha1(first).hexdigest() if first.endswith(b"\n") else None
+
+def _current_head(path: str) -> Optional[str]:
+    try:
+        with _open(pathlib.Path(path)) as f:
+            return _head(f)
+    except OSError:
+        return None
+
+def _row(file_id: int, run_id: str, line: bytes) -> Optional[Tuple]:
+    try:
+        ev = json.loads(line)
+    except ValueError:
+        return None  # a torn or foreign line; the log format is one JSON object per line
+    data = ev.get("data")
+    if not isinstance(data, dict):
+        data = {"value": data}
+    duration = data.get("duration_ms")
+    return (file_id, run_id, ev.get("ts"), ev.get("role"), ev.get("type"), data.get("task_id"),
+            data.get("span"), data.get("model"),
+            float(duration) if isinstance(duration, (int, float)) else None,
+            json.dumps(data, separators=(",", ":")))
+
+class LogIndex:
+    def __init__(self, path: pathlib.Path = INDEX_PATH, log_dir: pathlib.Path = LOG_DIR):
+        self.path = pathlib.Path(path)
+        self.log_dir = pathlib.Path(log_dir)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # the index can always be rebuilt from the logs
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _log_files(self) -> List[pathlib.Path]:
+        if not self.log_dir.is_dir():
+            return []
+        return sorted(p for p in self.log_dir.iterdir() if p.is_file() and run_id_of(p))
+
+    def update(self) -> Dict[str, int]:
+        """Ingest new lines from every log file. Returns counts of files read and events added."""
+        files = read = added = 0
+        known = {r["path"]: r for r in self.db.execute("SELECT * FROM files")}
+        for path in self._log_files():
+            files += 1
+            st = path.stat()
+            rec = known.get(str(path))
+            if rec and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+                continue
+            n = self._ingest(path, st, rec)
+            read += 1
+            added += n
+        return {"files": files, "read": read, "events": added}
+
+    def _ingest(self, path: pathlib.Path, st: os.stat_result, rec: Optional[sqlite3.Row]) -> int:
+        with _open(path) as f:
+            head = _head(f)
+            if head is None:
+                return 0  # nothing complete yet
+            if rec is None or rec["head"] != head:
+                # Same first line under another path: the live log was rotated (and maybe
+                # gzipped) since it was indexed; continue that record instead of re-reading
+                rec = self._adopt(path, head)
+            offset = rec["pos"]
+            f.seek(offset)  # gzip seeks by reading through; segments are small and read once
+            rows, consumed = [], 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # the writer is mid-line; pick it up next time
+                consumed += len(line)
+                row = _row(rec["id"], rec["run_id"], line)
+                if row:
+                    rows.append(row)
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO events (file_id, run_id, ts, role, type, task_id, span, model, duration_ms, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("UPDATE files SET size = ?, mtime_ns = ?, pos = ? WHERE id = ?",
+                            (st.st_size, st.st_mtime_ns, offset + consumed, rec["id"]))
+        return len(rows)
+
+    def _adopt(self, path: pathlib.Path, head: str) -> sqlite3.Row:
+        """
+        The file record for path: that of the same run's log with the same first line
+        which has left its old path (rotated / compressed), else a new one.
+        """
+        run_id = run_id_of(path)
+        with self.db:
+            # A different log used to live at this path (e.g. the live file before rotation):
+            # park its record until its new path turns up
+            self.db.execute("UPDATE files SET path = path || '#moved-' || id WHERE path = ? AND head != ?",
+                            (str(path), head))
+            moved = None
+            for cand in self.db.execute("SELECT id, path FROM files WHERE run_id = ? AND head = ? AND path != ?",
+                                        (run_id, head, str(path))).fetchall():
+                if "#moved-" in cand["path"] or _current_head(cand["path"]) != head:
+                    moved = cand
+                    break
+            if moved:
+                self.db.execute("UPDATE files SET path = ?, size = NULL WHERE id = ?", (str(path), moved["id"]))
+            else:
+                self.db.execute("INSERT INTO files (path, run_id, head, pos) VALUES (?, ?, ?, 0)",
+                                (str(path), run_id, head))
+        return self.db.execute("SELECT * FROM files WHERE path = ?", (str(path),)).fetchone()
+
+    # -- queries
+
+    @staticmethod
+    def _where(filters: Dict[str, Any], data: Dict[str, Any] = None, since: str = None,
+               until: str = None) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        for col, value in (filters or {}).items():
+            if value is None:
+                continue
+            if col not in COLUMNS:
+                raise ValueError(f"Unknown column: '{col}' (expected one of: {', '.join(COLUMNS)})")
+            clauses.append(f"{col} = ?")
+            params.append(value)
+        for key, value in (data or {}).items():
+            clauses.append("json_extract(data, ?) = ?")
+            # json_extract returns SQL values: booleans as 0/1, objects as JSON text
+            params += [f"$.{key}", int(value) if isinstance(value, bool) else value]
+        if since:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until:
+            clauses.append("ts < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def events(self, limit: int = 100, data: Dict[str, Any] = None, since: str = None, until: str = None,
+               **filters) -> List[Dict[str, Any]]:
+        """Matching events, newest first. filters: column=value; data: {key: value} on the event's data."""
+        where, params = self._where(filters, data, since, until)
+        rows = self.db.execute(f"SELECT run_id, ts, role, type, data FROM events{where}"
+                               f" ORDER BY ts DESC LIMIT ?", params + [int(limit)]).fetchall()
+        return [{"run_id": r["run_id"], "ts": r["ts"], "role": r["role"], "type": r["type"],
+                 "data": json.loads(r["data"])} for r in rows]
+
+    def aggregate(self, by: Iterable[str], value: str = None, data: Dict[str, Any] = None,
+                  since: str = None, until: str = None, limit: int = 50, **filters) -> List[Dict[str, Any]]:
+        """
+        Group matching events by columns (or data.<key>) and return count, plus
+        avg/min/max/sum of `value` (a column such as duration_ms, or data.<key>)
+        when given. Sorted by count.
+        """
+        groups = [self._expr(col) for col in by]
+        select = [f"{expr} AS {json.dumps(col)}" for col, expr in zip(by, groups)] + ["COUNT(*) AS count"]
+        if value:
+            v = self._expr(value)
+            select += [f"AVG({v}) AS avg", f"MIN({v}) AS min", f"MAX({v}) AS max", f"SUM({v}) AS sum"]
+        where, params = self._where(filters, data, since, until)
+        group = f" GROUP BY {', '.join(groups)}" if groups else ""
+        rows = self.db.execute(f"SELECT {', '.join(select)} FROM events{where}{group}"
+                               f" ORDER BY count DESC LIMIT ?", params + [int(limit)]).fetchall()
+        return [dict(r) for r in rows]
+
+    @staticmethod
+    def _expr(col: str) -> str:
+        if col in COLUMNS:
+            return col
+        if col.startswith("data.") and re.fullmatch(r"[\w.]+", col[5:]):
+            return f"json_extract(data, '$.{col[5:]}')"
+        raise ValueError(f"Unknown field: '{col}' (use a column: {', '.join(COLUMNS)}, or data.<key>)")
+
+    def sql(self, statement: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        """Arbitrary SQL over the events / files tables, on a read-only connection."""
+        db = sqlite3.connect(f"file:{self.path.resolve().as_posix()}?mode=ro", uri=True, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            return [dict(r) for r in db.execute(statement, tuple(params)).fetchall()]
+        finally:
+            db.close()
@@ -1,15 +1,182 @@
 # core/logging.py
+import atexit
+import gzip
 import json
+import os
 import pathlib
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+_LOCK = threading.Lock()
+
+def _event(role: str, type_: str, data: Dict[str, Any]) -> str:
+    return json.dumps({
+        "ts": datetime.utcnow().isoformat() + "Z",
+        "role": role,
+        "type": type_,
+        "data": data
+    }) + "\n"
 
 def log(role: str, type_: str, data: Dict[str, Any], log_file: pathlib.Path):
-    log_file.parent.mkdir(parents=True, exist_ok=True)
-    with log_file.open("a", encoding="utf-8") as f:
-        f.write(json.dumps({
-            "ts": datetime.utcnow().isoformat() + "Z",
-            "role": role,
-            "type": type_,
-            "data": data
-        }) + "\n")
+    line = _event(role, type_, data)
+    # Tasks may run concurrently; keep each event on its own line
+    with _LOCK:
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        with log_file.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+_STOP = object()
+
+class RunLogger:
+    """
+    Buffered JSONL run log. Callers serialize and enqueue events (callable as
+    log_func(role, type_, data)); a background thread appends them in batches
+    through one open file handle. Same format and append-only guarantee as log().
+
+    fsync: "never" (leave it to the OS), "batch" (after every write) or
+    "interval" (at most every fsync_interval seconds). With rotate_bytes, a full
+    log is moved to <name>.<n>.log.jsonl (gzip-compressed with compress=True) and
+    a fresh file is started.
+    """
+
+    def __init__(self, log_file: pathlib.Path, max_queue: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 0.2, fsync: str = "never", fsync_interval: float = 1.0,
+                 rotate_bytes: Optional[int] = None, compress: bool = False):
+        if fsync not in ("never", "batch", "interval"):
+            raise ValueError(f"Unknown fsync policy: '{fsync}'")
+        self.log_file = pathlib.Path(log_file)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.rotate_bytes = int(rotate_bytes) if rotate_bytes else None
+        self.compress = bool(compress)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=int(max_queue))
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._segment = 0
+        self._closed = False
+        # Orders enqueues against close(), so no event lands after _STOP
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._writer, name="run-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, role: str, type_: str, data: Dict[str, Any]) -> None:
+        # Serialize now so later mutation of `data` by the caller can't change the record.
+        line = _event(role, type_, data)
+        with self._lock:
+            if not self._closed:
+                # put() blocks when the queue is full: backpressure rather than dropped events.
+                # The writer thread never takes the lock, so it keeps draining meanwhile.
+                self._queue.put(line)
+                return
+        # Late events (e.g. from atexit handlers) are still recorded
+        log(role, type_, data, self.log_file)
+
+    def flush(self) -> None:
+        """Block until every event enqueued so far is written."""
+        self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _open(self):
+        if self._file is None:
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            self._file = self.log_file.open("a", encoding="utf-8")
+        return self._file
+
+    def _close_file(self) -> None:
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _rotate(self) -> None:
+        self._close_file()
+        stem = self.log_file.name[:-len(".log.jsonl")] if self.log_file.name.endswith(".log.jsonl") \
+            else self.log_file.stem
+        while True:
+            self._segment += 1
+            target = self.log_file.with_name(f"{stem}.{self._segment}.log.jsonl")
+            if not target.exists() and not target.with_name(target.name + ".gz").exists():
+                break
+        os.replace(self.log_file, target)
+        if self.compress:
+            with target.open("rb") as src, gzip.open(str(target) + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            target.unlink()
+
+    def _write(self, lines) -> None:
+        data = "".join(lines)
+        f = self._open()
+        if self.rotate_bytes and f.tell() > 0 and f.tell() + len(data) > self.rotate_bytes:
+            self._rotate()
+            f = self._open()
+        f.write(data)
+        f.flush()
+        now = time.monotonic()
+        if self.fsync == "batch" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(f.fileno())
+            self._last_fsync = now
+
+    def _writer(self) -> None:
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            taken = 1
+            while True:
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                # Keep draining so producers never block forever; retry once with plain appends
+                self._close_file()
+                try:
+                    for line in batch:
+                        with _LOCK, self.log_file.open("a", encoding="utf-8") as f:
+                            f.write(line)
+                except OSError:
+                    print(f"[run-logger] dropped {len(batch)} events: {e}")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+        if self._file is not None:
+            try:
+                self._file.flush()
+                if self.fsync != "never":
+                    os.fsync(self._file.fileno())
+            finally:
+                self._close_file()
+
+def logger_from_cfg(log_file: pathlib.Path, cfg: Optional[Dict[str, Any]]) -> RunLogger:
+    """Build a RunLogger from the `logging` section of policies.yaml."""
+    return RunLogger(log_file, **(cfg or {}))
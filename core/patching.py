@@ -0,0 +1,27 @@
+# core/patching.py
+"""
+Search/replace hunks for coder edits, applied against the file content the coder saw.
+"""
+from typing import Dict, Any, List
+
+class PatchConflictError(RuntimeError):
+    """A hunk does not apply cleanly, or the file changed since the coder read it."""
+
+def apply_hunks(original: str, hunks: List[Dict[str, Any]], path: str) -> str:
+    """
+    Apply hunks in order. Each `search` block must occur exactly once in the current
+    text; an empty `search` appends `replace` to the end of the file.
+    """
+    text = original
+    for i, hunk in enumerate(hunks):
+        search, replace = hunk["search"], hunk["replace"]
+        if not search:
+            text = text + replace
+            continue
+        count = text.count(search)
+        if count == 0:
+            raise PatchConflictError(f"Hunk {i + 1} for {path}: search text not found")
+        if count > 1:
+            raise PatchConflictError(f"Hunk {i + 1} for {path}: search text is ambiguous ({count} matches)")
+        text = text.replace(search, replace, 1)
+    return text
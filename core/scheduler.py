@@ -0,0 +1,184 @@
+# core/scheduler.py
+import ast
+import contextvars
+import pathlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Set, Callable, Awaitable
+
+def _module_names(rel: str) -> Set[str]:
+    """Dotted module names a .py artifact provides, e.g. 'pkg/mod.py' -> {'pkg.mod', 'mod'}."""
+    if not rel.endswith(".py"):
+        return set()
+    parts = rel[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    names = set()
+    for i in range(len(parts)):
+        names.add(".".join(parts[i:]))
+    return names
+
+def _imports(path: pathlib.Path) -> Set[str]:
+    try:
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return set()
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            found.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            found.add(node.module)
+            found.update(f"{node.module}.{a.name}" for a in node.names)
+    return found
+
+def build_dag(tasks: List[Dict[str, Any]], workspace_path: pathlib.Path) -> Dict[str, Set[str]]:
+    """
+    Map each task id to the ids of earlier tasks it must wait for.
+
+    Explicit `depends_on` lists from the plan are added to the inferred dependencies,
+    never substituted for them: overlapping artifacts, import edges from existing
+    artifact files, and test files named after another task's module (test_<mod>.py).
+    Overlapping artifacts always serialize, since two tasks must never write the same file.
+    On a fresh plan no artifact exists yet, so imports between new files are only
+    known from depends_on (prompts/planner.md requires it).
+    """
+    ids = [t["id"] for t in tasks]
+    deps: Dict[str, Set[str]] = {tid: set() for tid in ids}
+
+    for i, t in enumerate(tasks):
+        arts = set(t.get("artifacts", []) or [])
+        for d in t.get("depends_on", []) or []:
+            if d not in deps:
+                raise RuntimeError(f"Task {t['id']} depends on unknown task: {d}")
+            if d == t["id"]:
+                raise RuntimeError(f"Task {t['id']} depends on itself")
+            deps[t["id"]].add(d)
+        imported: Set[str] = set()
+        stems = set()
+        for rel in arts:
+            p = workspace_path / rel
+            if rel.endswith(".py") and p.is_file():
+                imported |= _imports(p)
+            name = pathlib.PurePosixPath(rel).name
+            if name.startswith("test_") and name.endswith(".py"):
+                stems.add(name[len("test_"):-3])
+        for prev in tasks[:i]:
+            prev_arts = set(prev.get("artifacts", []) or [])
+            if arts & prev_arts:
+                deps[t["id"]].add(prev["id"])
+                continue
+            provided = set()
+            for rel in prev_arts:
+                provided |= _module_names(rel)
+            if imported & provided or any(rel.endswith(f"/{s}.py") or rel == f"{s}.py"
+                                          for s in stems for rel in prev_arts):
+                deps[t["id"]].add(prev["id"])
+
+    _check_acyclic(deps)
+    return deps
+
+def _check_acyclic(deps: Dict[str, Set[str]]) -> None:
+    state: Dict[str, int] = {}
+
+    def visit(n: str):
+        if state.get(n) == 1:
+            raise RuntimeError(f"Dependency cycle in plan at task {n}")
+        if state.get(n) == 2:
+            return
+        state[n] = 1
+        for d in deps[n]:
+            visit(d)
+        state[n] = 2
+
+    for n in deps:
+        visit(n)
+
+def run_dag(tasks: List[Dict[str, Any]], deps: Dict[str, Set[str]],
+            worker: Callable[[Dict[str, Any]], bool], max_workers: int = 1) -> Dict[str, str]:
+    """
+    Run `worker(task)` for every task once its dependencies have passed, with at most
+    `max_workers` tasks in flight. Ready tasks start in plan order, so max_workers=1
+    reproduces the sequential loop. After the first failure no new task is started
+    (halt-on-failure); tasks already in flight are allowed to finish.
+
+    Returns task id -> "passed" | "failed" | "skipped".
+    """
+    max_workers = max(1, int(max_workers))
+    status: Dict[str, str] = {}
+    pending = list(tasks)
+    halted = False
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            if not halted:
+                for t in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if all(status.get(d) == "passed" for d in deps[t["id"]]):
+                        pending.remove(t)
+                        # Copy the context so tracing spans nest under the caller's
+                        running[pool.submit(contextvars.copy_context().run, worker, t)] = t["id"]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                tid = running.pop(fut)
+                try:
+                    ok = fut.result()
+                except Exception as e:
+                    # Stop scheduling, let in-flight tasks finish, then surface the error
+                    ok = False
+                    error = error or e
+                status[tid] = "passed" if ok else "failed"
+                if not ok:
+                    halted = True
+
+    if error:
+        raise error
+    for t in pending:
+        status.setdefault(t["id"], "skipped")
+    return status
+
+async def arun_dag(tasks: List[Dict[str, Any]], deps: Dict[str, Set[str]],
+                   worker: Callable[[Dict[str, Any]], Awaitable[bool]], max_workers: int = 1) -> Dict[str, str]:
+    """
+    asyncio counterpart of run_dag: same ordering, halt-on-failure and result shape,
+    with task pipelines running as coroutines on the current event loop.
+    """
+    import asyncio
+    max_workers = max(1, int(max_workers))
+    status: Dict[str, str] = {}
+    pending = list(tasks)
+    halted = False
+    error = None
+    running = {}
+
+    while pending or running:
+        if not halted:
+            for t in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if all(status.get(d) == "passed" for d in deps[t["id"]]):
+                    pending.remove(t)
+                    running[asyncio.ensure_future(worker(t))] = t["id"]
+        if not running:
+            break
+        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for fut in done:
+            tid = running.pop(fut)
+            try:
+                ok = fut.result()
+            except Exception as e:
+                ok = False
+                error = error or e
+            status[tid] = "passed" if ok else "failed"
+            if not ok:
+                halted = True
+
+    if error:
+        raise error
+    for t in pending:
+        status.setdefault(t["id"], "skipped")
+    return status
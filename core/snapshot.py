@@ -0,0 +1,197 @@
+# core/snapshot.py
+"""
+Content-addressed workspace snapshots. A snapshot is a manifest {path: sha256} of
+the workspace (or of selected paths); file contents are stored once per hash
+under blobs/, so unchanged files cost nothing. restore() rewrites only the files
+whose hash differs from the manifest (staged + renamed, see write_files) and
+removes files the snapshot did not have.
+
+The store lives in <workspace>/.cache/snapshots (skipped by the workspace walk).
+Snapshots only matter within a run: prune() drops old manifests and overlays and
+then every blob no remaining manifest refers to.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from core.index import IGNORE_DIRS, IGNORE_PATTERNS
+from core.tracing import span, annotate
+from core.workspace import ensure_in_workspace, write_files
+
+class SnapshotStore:
+    def __init__(self, workspace_path: pathlib.Path, root: Optional[pathlib.Path] = None):
+        self.workspace_path = pathlib.Path(workspace_path).resolve()
+        self.root = pathlib.Path(root) if root else self.workspace_path / ".cache" / "snapshots"
+        self.blob_dir = self.root / "blobs"
+        self.manifest_dir = self.root / "manifests"
+        # rel -> (size, mtime_ns, sha256): avoids rehashing files that didn't change
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest: str) -> pathlib.Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def _hash(self, rel: str) -> Optional[str]:
+        """sha256 of a workspace file (None if absent), storing its blob on first sight."""
+        p = self.workspace_path / rel
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            return None
+        cached = self._hashes.get(rel)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        data = p.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f".{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            # Read-only: blobs may be hard-linked into overlays (see checkout)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, blob)
+        self._hashes[rel] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def _walk(self) -> List[str]:
+        paths = []
+        for root, dirs, files in os.walk(self.workspace_path):
+            dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS)
+            for name in files:
+                if name.endswith(".tmp") or any(fnmatch.fnmatch(name, pat) for pat in IGNORE_PATTERNS):
+                    continue
+                paths.append((pathlib.Path(root) / name).relative_to(self.workspace_path).as_posix())
+        return paths
+
+    def snapshot(self, paths: Optional[Iterable[str]] = None) -> str:
+        """
+        Record the current content of `paths` (default: the whole workspace) and
+        return the snapshot id. Paths that don't exist are recorded as absent.
+        """
+        with span("snapshot.take"), self._lock:
+            rels = sorted(set(paths)) if paths is not None else self._walk()
+            files = {rel: self._hash(rel) for rel in rels}
+            manifest = {"scope": "paths" if paths is not None else "workspace", "files": files}
+            text = json.dumps(manifest, sort_keys=True)
+            snap_id = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+            target = self.manifest_dir / f"{snap_id}.json"
+            if not target.exists():
+                self.manifest_dir.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_name(f".{snap_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+                tmp.write_text(text, encoding="utf-8")
+                os.replace(tmp, target)
+            annotate(files=len(files))
+            return snap_id
+
+    def manifest(self, snap_id: str) -> Dict[str, Any]:
+        with (self.manifest_dir / f"{snap_id}.json").open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def diff(self, snap_id: str) -> Dict[str, List[str]]:
+        """Paths that differ between the workspace and a snapshot: changed, added (absent in it), missing."""
+        m = self.manifest(snap_id)
+        files = m["files"]
+        with self._lock:
+            current_paths = set(files) if m["scope"] == "paths" else set(self._walk()) | set(files)
+            out = {"changed": [], "added": [], "missing": []}
+            for rel in sorted(current_paths):
+                want, have = files.get(rel), self._hash(rel)
+                if want == have:
+                    continue
+                if want is None:
+                    out["added"].append(rel)
+                elif have is None:
+                    out["missing"].append(rel)
+                else:
+                    out["changed"].append(rel)
+            return out
+
+    def restore(self, snap_id: str) -> List[str]:
+        """Bring the snapshot's paths back to their recorded content. Returns the paths touched."""
+        with span("snapshot.restore", snapshot=snap_id):
+            files = self.manifest(snap_id)["files"]
+            d = self.diff(snap_id)
+            writes = {}
+            for rel in d["changed"] + d["missing"]:
+                writes[ensure_in_workspace(rel, self.workspace_path)] = self._blob_path(files[rel]).read_bytes()
+            write_files(writes)
+            for rel in d["added"]:
+                ensure_in_workspace(rel, self.workspace_path).unlink(missing_ok=True)
+            touched = d["changed"] + d["missing"] + d["added"]
+            annotate(files=len(touched))
+            return touched
+
+    def checkout(self, snap_id: str, dest: pathlib.Path, link: bool = False) -> None:
+        """
+        Materialize a snapshot into another directory (e.g. an overlay for a parallel
+        attempt). link=True hard-links the read-only blobs instead of copying them;
+        writers that replace files (write_files) are unaffected, in-place writes fail.
+        """
+        dest = pathlib.Path(dest)
+        writes = {}
+        with span("snapshot.checkout", snapshot=snap_id, link=link):
+            for rel, digest in self.manifest(snap_id)["files"].items():
+                if digest is None:
+                    continue
+                target = dest / rel
+                if link:
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    try:
+                        os.link(self._blob_path(digest), target)
+                        continue
+                    except OSError:
+                        pass  # e.g. another filesystem: copy instead
+                writes[target] = self._blob_path(digest).read_bytes()
+            write_files(writes)
+
+    def prune(self, max_age_seconds: float = 0.0) -> Dict[str, int]:
+        """
+        Remove manifests and overlays older than max_age_seconds (0: all), then
+        mark-and-sweep the blobs: those no remaining manifest refers to are deleted.
+        """
+        cutoff = time.time() - max_age_seconds
+        counts = {"manifests": 0, "overlays": 0, "blobs": 0}
+        with span("snapshot.prune"), self._lock:
+            referenced = set()
+            for path in (self.manifest_dir.glob("*.json") if self.manifest_dir.is_dir() else []):
+                try:
+                    if path.stat().st_mtime <= cutoff:
+                        path.unlink()
+                        counts["manifests"] += 1
+                        continue
+                    referenced.update(d for d in json.loads(path.read_text(encoding="utf-8"))["files"].values() if d)
+                except (OSError, ValueError, KeyError):
+                    continue
+            overlays = self.root / "overlays"
+            for path in (overlays.iterdir() if overlays.is_dir() else []):
+                try:
+                    if path.stat().st_mtime > cutoff:
+                        continue
+                except OSError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                counts["overlays"] += 1
+            for path in (self.blob_dir.glob("*/*") if self.blob_dir.is_dir() else []):
+                if path.name not in referenced:
+                    path.unlink(missing_ok=True)
+                    counts["blobs"] += 1
+            # Known hashes must not point at deleted blobs (see _hash)
+            self._hashes = {rel: h for rel, h in self._hashes.items() if h[2] in referenced}
+            annotate(**counts)
+        return counts
+
+_STORES: Dict[str, SnapshotStore] = {}
+_STORES_LOCK = threading.Lock()
+
+def get_store(workspace_path: pathlib.Path) -> SnapshotStore:
+    key = str(pathlib.Path(workspace_path).resolve())
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = SnapshotStore(pathlib.Path(key))
+        return _STORES[key]
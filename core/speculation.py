@@ -0,0 +1,84 @@
+# core/speculation.py
+"""
+Speculative coding for linear plans: while task N is under test, the coder already
+proposes edits for the next task, against the workspace as it is at that moment.
+The proposal is committed only when that next task actually starts (so N passed)
+and none of the files it was based on changed since; otherwise it is discarded
+and the task is coded normally.
+"""
+import pathlib
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional
+
+class Speculator:
+    def __init__(self, coder, tasks: List[Dict[str, Any]], workspace_path: pathlib.Path,
+                 project_root: str = None, log_func=None):
+        self.coder = coder
+        self.workspace_path = workspace_path
+        self.project_root = project_root
+        self.log_func = log_func
+        # Plan order: the task expected to run after each one
+        self.next_task = {tasks[i]["id"]: tasks[i + 1] for i in range(len(tasks) - 1)}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, Any] = {}  # task id -> Future or asyncio.Task
+
+    def start_after(self, task_id: str) -> None:
+        """Begin proposing the task that follows task_id (no-op if there is none or it's already started)."""
+        nxt = self.next_task.get(task_id)
+        if nxt is None or nxt["id"] in self._pending:
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-coder")
+        self._pending[nxt["id"]] = self._pool.submit(
+            self.coder.propose, nxt, self.workspace_path, None, self.project_root, self.log_func)
+        self.log_func("orchestrator", "speculation_start", {"task_id": nxt["id"], "after": task_id})
+
+    def astart_after(self, task_id: str) -> None:
+        """asyncio version of start_after; call from a running event loop."""
+        import asyncio
+        nxt = self.next_task.get(task_id)
+        if nxt is None or nxt["id"] in self._pending:
+            return
+        self._pending[nxt["id"]] = asyncio.ensure_future(
+            self.coder.apropose(nxt, self.workspace_path, None, self.project_root, self.log_func))
+        self.log_func("orchestrator", "speculation_start", {"task_id": nxt["id"], "after": task_id})
+
+    def take(self, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Committed edits ({"edits": [...]}) if a still-valid proposal exists for task, else None."""
+        fut: Future = self._pending.pop(task["id"], None)
+        if fut is None:
+            return None
+        try:
+            proposal = fut.result()
+        except Exception as e:
+            return self._miss(task, f"proposal failed: {e}")
+        return self._commit(task, proposal)
+
+    async def atake(self, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        fut = self._pending.pop(task["id"], None)
+        if fut is None:
+            return None
+        try:
+            proposal = await fut
+        except Exception as e:
+            return self._miss(task, f"proposal failed: {e}")
+        return self._commit(task, proposal)
+
+    def _commit(self, task: Dict[str, Any], proposal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not self.coder.is_current(proposal, self.workspace_path):
+            return self._miss(task, "context files changed")
+        self.log_func("orchestrator", "speculation_hit", {"task_id": task["id"]})
+        return self.coder.commit(proposal, self.workspace_path, self.project_root, self.log_func)
+
+    def _miss(self, task: Dict[str, Any], reason: str) -> Optional[Dict[str, Any]]:
+        self.log_func("orchestrator", "speculation_miss", {"task_id": task["id"], "reason": reason})
+        return None
+
+    def close(self) -> None:
+        """Drop unused proposals (their edits were never written)."""
+        for fut in self._pending.values():
+            fut.cancel()
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,142 @@
+# core/state.py
+"""
+Durable run state (runs/<run_id>.state.json): the goal, the plan, and per task its
+status, attempts, the hashes of the files it wrote and its last test result.
+`python main.py --resume <run_id>` reuses the plan and skips tasks that passed
+and whose artifacts still hash to what the pipeline last wrote.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+STATE_DIR = pathlib.Path("runs")
+TASK_STATUSES = ("pending", "running", "passed", "failed")
+
+def file_hash(path: pathlib.Path) -> Optional[str]:
+    try:
+        return hashlib.sha1(path.read_bytes()).hexdigest()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+class RunState:
+    def __init__(self, path: pathlib.Path, data: Dict[str, Any]):
+        self.path = pathlib.Path(path)
+        self.data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, run_id: str, goal: str, workspace_path: pathlib.Path,
+               state_dir: pathlib.Path = STATE_DIR) -> "RunState":
+        state = cls(pathlib.Path(state_dir) / f"{run_id}.state.json", {
+            "run_id": run_id,
+            "goal": goal,
+            "workspace": str(workspace_path),
+            "created": _now(),
+            "plan": None,
+            "tasks": {},
+            # Last hash the pipeline wrote per workspace path; outside changes show up as mismatches
+            "files": {},
+        })
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, run_id: str, state_dir: pathlib.Path = STATE_DIR) -> "RunState":
+        path = pathlib.Path(state_dir) / f"{run_id}.state.json"
+        if not path.exists():
+            raise FileNotFoundError(f"No run state for '{run_id}' ({path})")
+        with path.open("r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def save(self) -> None:
+        """Atomic rewrite: a crash leaves the previous state intact."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    @property
+    def plan(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("plan")
+
+    def set_plan(self, plan: Dict[str, Any]) -> None:
+        with self._lock:
+            self.data["plan"] = plan
+            for t in plan.get("tasks", []):
+                self.data["tasks"].setdefault(t["id"], {"status": "pending", "attempts": 0,
+                                                        "artifacts": list(t.get("artifacts", []) or [])})
+            self.save()
+
+    def _task(self, task_id: str) -> Dict[str, Any]:
+        return self.data["tasks"].setdefault(task_id, {"status": "pending", "attempts": 0, "artifacts": []})
+
+    def completed(self, task_id: str, workspace_path: pathlib.Path) -> bool:
+        """True if the task passed and none of its artifacts changed since the pipeline wrote them."""
+        with self._lock:
+            rec = self.data["tasks"].get(task_id)
+            if not rec or rec.get("status") != "passed":
+                return False
+            files = self.data["files"]
+            return all(rel in files and file_hash(workspace_path / rel) == files[rel]
+                       for rel in rec.get("artifacts", []))
+
+    def start(self, task_id: str) -> None:
+        with self._lock:
+            rec = self._task(task_id)
+            rec["status"] = "running"
+            rec["started"] = _now()
+            self.save()
+
+    def record_edits(self, task_id: str, edits: List[str], workspace_path: pathlib.Path) -> None:
+        with self._lock:
+            rec = self._task(task_id)
+            rec["attempts"] = rec.get("attempts", 0) + 1
+            hashes = {rel: file_hash(workspace_path / rel) for rel in edits}
+            rec["edits"] = hashes
+            self.data["files"].update(hashes)
+            self.save()
+
+    def record_test(self, task_id: str, test_res: Dict[str, Any]) -> None:
+        with self._lock:
+            rec = self._task(task_id)
+            rec["test"] = {
+                "passed": bool(test_res.get("passed", False)),
+                "report": (test_res.get("report") or "")[-1000:],
+            }
+            if test_res.get("selected_tests") is not None:
+                rec["test"]["selected_tests"] = test_res["selected_tests"]
+            self.save()
+
+    def record_restore(self, task_id: str, paths: List[str], workspace_path: pathlib.Path) -> None:
+        """Files put back from a snapshot (not a new attempt)."""
+        with self._lock:
+            rec = self._task(task_id)
+            rec["rollbacks"] = rec.get("rollbacks", 0) + 1
+            self.data["files"].update({rel: file_hash(workspace_path / rel) for rel in paths})
+            self.save()
+
+    def finish(self, task_id: str, passed: bool, workspace_path: pathlib.Path) -> None:
+        with self._lock:
+            rec = self._task(task_id)
+            rec["status"] = "passed" if passed else "failed"
+            rec["finished"] = _now()
+            if passed:
+                # Baseline for resume: every artifact as it stands when the task passed
+                for rel in rec.get("artifacts", []):
+                    self.data["files"][rel] = file_hash(workspace_path / rel)
+            self.save()
+
+    def summary(self) -> Dict[str, int]:
+        counts = {s: 0 for s in TASK_STATUSES}
+        with self._lock:
+            for rec in self.data["tasks"].values():
+                counts[rec.get("status", "pending")] += 1
+        return counts
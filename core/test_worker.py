@@ -0,0 +1,253 @@
+# core/test_worker.py
+"""
+Warm test runner: one long-lived interpreter per workspace with pytest and its
+plugins already imported. Each request is served by a forked child, so workspace
+modules are imported fresh in every run (edited files are always picked up, and
+nothing a test does leaks into the next run) while interpreter and plugin startup
+is paid once.
+
+Children run under the same resource limits and output cap as cold subprocesses
+(apply_limits, shared with core/execution.py).
+
+This file runs standalone as the worker process (`python test_worker.py --serve`)
+and must only import the standard library and pytest at module level.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+_POLL_SECONDS = 0.005
+# Prepended to output that was cut to its last max_output_bytes
+TRUNCATED_NOTE = "[... {} bytes of earlier output dropped ...]\n"
+
+def resolve_limits(limits: Optional[Dict[str, Optional[int]]]) -> List[Tuple[int, int, int]]:
+    """
+    (resource, soft, hard) for the limits config: cpu_seconds (SIGXCPU, SIGKILL
+    shortly after), memory_mb (address space; larger allocations fail with
+    MemoryError) and open_files. Missing / null entries stay unlimited; a limit is
+    never raised above the inherited hard limit.
+    """
+    if not limits or os.name != "posix":
+        return []
+    import resource
+    table = {
+        "cpu_seconds": (resource.RLIMIT_CPU, 1),
+        "memory_mb": (resource.RLIMIT_AS, 1024 * 1024),
+        "open_files": (resource.RLIMIT_NOFILE, 1),
+    }
+    out = []
+    for key, (res, scale) in table.items():
+        if not limits.get(key):
+            continue
+        soft = hard = int(limits[key]) * scale
+        if res == resource.RLIMIT_CPU:
+            hard = soft + 5  # SIGXCPU at the soft limit lets the child report; SIGKILL at the hard one
+        current = resource.getrlimit(res)[1]
+        if current != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current), min(hard, current)
+        out.append((res, soft, hard))
+    return out
+
+def apply_limits(limits: Optional[Dict[str, Optional[int]]]) -> None:
+    """Set the limits (see resolve_limits) on the current process, e.g. a child before it runs the command."""
+    import resource
+    for res, soft, hard in resolve_limits(limits):
+        resource.setrlimit(res, (soft, hard))
+
+def read_tail(f, max_bytes: Optional[int]) -> str:
+    """The last max_bytes of a binary file (all of it when max_bytes is None), as text."""
+    size = f.seek(0, os.SEEK_END)
+    start = max(0, size - max_bytes) if max_bytes else 0
+    f.seek(start)
+    text = f.read().decode("utf-8", errors="replace")
+    return TRUNCATED_NOTE.format(start) + text if start else text
+
+def _run_child(argv: List[str], out_fd: int, err_fd: int, limits: Optional[Dict] = None) -> int:
+    os.dup2(out_fd, 1)
+    os.dup2(err_fd, 2)
+    sys.stdout = os.fdopen(1, "w", buffering=1, encoding="utf-8", errors="replace", closefd=False)
+    sys.stderr = os.fdopen(2, "w", buffering=1, encoding="utf-8", errors="replace", closefd=False)
+    sys.stdin = open(os.devnull, "r")
+    try:
+        apply_limits(limits)
+        if argv[0] == "pytest":
+            import pytest
+            sys.argv = argv
+            return int(pytest.main(argv[1:]))
+        if argv[:2] == ["python", "-c"]:
+            # Match `python -c`: cwd first on sys.path, code runs as __main__
+            sys.path.insert(0, "")
+            sys.argv = ["-c"] + argv[3:]
+            exec(compile(argv[2], "<string>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+            return 0
+        print(f"Unsupported command for warm worker: {argv}", file=sys.stderr)
+        return 2
+    except SystemExit as e:
+        code = e.code
+        if code is None:
+            return 0
+        if isinstance(code, int):
+            return code
+        print(code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # The child has not called setsid yet
+        os.kill(pid, signal.SIGKILL)
+
+def _handle(request: Dict) -> Dict:
+    argv = request["argv"]
+    timeout = float(request.get("timeout", 60))
+    max_output = request.get("max_output_bytes")
+    # Output goes to disk, not memory; only its tail is read back
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                # Own process group, so a timeout also kills whatever the tests started
+                os.setsid()
+                code = _run_child(argv, out.fileno(), err.fileno(), request.get("limits"))
+            finally:
+                os._exit(code & 0xFF)
+        deadline = time.monotonic() + timeout
+        status = None
+        while status is None:
+            done, raw = os.waitpid(pid, os.WNOHANG)
+            if done:
+                status = raw
+            elif time.monotonic() > deadline:
+                _kill_group(pid)
+                os.waitpid(pid, 0)
+                return {"timeout": True}
+            else:
+                time.sleep(_POLL_SECONDS)
+        return {
+            "returncode": os.waitstatus_to_exitcode(status),
+            "stdout": read_tail(out, max_output),
+            "stderr": read_tail(err, max_output),
+        }
+
+def _warm() -> None:
+    """Import pytest and its installed plugins once, so forked children start with them loaded."""
+    import pytest  # noqa: F401
+    try:
+        from importlib.metadata import entry_points
+        plugins = entry_points().select(group="pytest11") if hasattr(entry_points(), "select") \
+            else entry_points().get("pytest11", [])
+        for ep in plugins:
+            try:
+                ep.load()
+            except Exception:
+                pass
+    except Exception:
+        pass
+
+def _serve() -> None:
+    # Keep the protocol channel private; stray prints must not corrupt it
+    channel = os.fdopen(os.dup(1), "w", buffering=1, encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # Drop this file's directory from sys.path so workspace imports behave as with the pytest script
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or ".") != here]
+    _warm()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            reply = _handle(json.loads(line))
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        channel.write(json.dumps(reply) + "\n")
+
+class WarmTestWorker:
+    """
+    Client for one worker process. Requests are serialized; callers get the same
+    CompletedProcess / TimeoutExpired contract as subprocess.run.
+    """
+
+    def __init__(self, workspace_path: str):
+        self.workspace_path = workspace_path
+        self.proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+
+    def _start(self) -> None:
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve"],
+            cwd=self.workspace_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+
+    def run(self, cmd: List[str], timeout: int = 60, limits: Optional[Dict] = None,
+            max_output_bytes: Optional[int] = None) -> subprocess.CompletedProcess:
+        request = {"argv": cmd, "timeout": timeout, "limits": limits, "max_output_bytes": max_output_bytes}
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+            try:
+                self.proc.stdin.write(json.dumps(request) + "\n")
+                self.proc.stdin.flush()
+                line = self.proc.stdout.readline()
+            except (BrokenPipeError, OSError):
+                line = ""
+            if not line:
+                self.close()
+                raise RuntimeError("Warm test worker exited unexpectedly")
+            reply = json.loads(line)
+        if reply.get("timeout"):
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if "error" in reply:
+            raise RuntimeError(f"Warm test worker failed: {reply['error']}")
+        return subprocess.CompletedProcess(cmd, reply["returncode"], reply["stdout"], reply["stderr"])
+
+    def close(self) -> None:
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+            self.proc = None
+
+_WORKERS: Dict[str, WarmTestWorker] = {}
+_WORKERS_LOCK = threading.Lock()
+
+def supported(cmd: List[str]) -> bool:
+    """Commands the worker can serve; everything else (e.g. pip install) runs cold."""
+    return hasattr(os, "fork") and (cmd[:1] == ["pytest"] or cmd[:2] == ["python", "-c"])
+
+def get_worker(workspace_path: str) -> WarmTestWorker:
+    key = os.path.abspath(workspace_path)
+    with _WORKERS_LOCK:
+        if key not in _WORKERS:
+            _WORKERS[key] = WarmTestWorker(key)
+        return _WORKERS[key]
+
+def shutdown_workers() -> None:
+    with _WORKERS_LOCK:
+        for w in _WORKERS.values():
+            w.close()
+        _WORKERS.clear()
+
+if __name__ == "__main__" and sys.argv[1:] == ["--serve"]:
+    _serve()
@@ -0,0 +1,207 @@
+# core/tracing.py
+"""
+Span-based run instrumentation. Wrap a phase in `with span("name", **attrs):`;
+nested spans record their parent, annotate() adds attributes (tokens, model,
+cache status, ...) to the innermost open span. Finished spans go to the run log
+and can be exported as Prometheus text or OTLP/JSON, plus a hot-spot summary table.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("agent0_span", default=None)
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "attrs", "start", "start_wall", "duration_ms", "error")
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, attrs: Dict[str, Any]):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.start_wall = time.time()
+        self.duration_ms = 0.0
+        self.error = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        d = {"span": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+             "duration_ms": round(self.duration_ms, 3)}
+        d.update(self.attrs)
+        if self.error:
+            d["error"] = self.error
+        return d
+
+class Tracer:
+    def __init__(self, log_func=None, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        self.log_func = log_func
+        # model -> {"input_per_1k": USD, "output_per_1k": USD, "cached_input_per_1k": USD (optional)}
+        self.pricing = pricing or {}
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = _CURRENT.get()
+        with self._lock:
+            self._next_id += 1
+            s = Span(self._next_id, parent.span_id if parent else None, name, attrs)
+        token = _CURRENT.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            s.error = type(e).__name__
+            raise
+        finally:
+            s.duration_ms = (time.perf_counter() - s.start) * 1000.0
+            _CURRENT.reset(token)
+            with self._lock:
+                self.spans.append(s)
+            if self.log_func:
+                self.log_func("trace", "span", s.as_dict())
+
+    def cost(self, s: Span) -> float:
+        price = self.pricing.get(s.attrs.get("model", ""))
+        if not price:
+            return 0.0
+        cached = s.attrs.get("cached_tokens", 0)
+        return ((s.attrs.get("prompt_tokens", 0) - cached) * price.get("input_per_1k", 0.0)
+                + cached * price.get("cached_input_per_1k", price.get("input_per_1k", 0.0))
+                + s.attrs.get("completion_tokens", 0) * price.get("output_per_1k", 0.0)) / 1000.0
+
+    def aggregate(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per span name: count, total/mean/p50/p99/max ms, token and cost totals.
+        cached_tokens is the prompt prefix the provider served from its cache,
+        prefix_tokens the reuse estimated locally (utils/prompt_cache.py).
+        """
+        groups: Dict[str, List[Span]] = {}
+        with self._lock:
+            for s in self.spans:
+                groups.setdefault(s.name, []).append(s)
+        stats = {}
+        for name, spans in groups.items():
+            durations = sorted(s.duration_ms for s in spans)
+            n = len(durations)
+            stats[name] = {
+                "count": n,
+                "total_ms": sum(durations),
+                "mean_ms": sum(durations) / n,
+                "p50_ms": durations[min(n - 1, int(0.50 * n))],
+                "p99_ms": durations[min(n - 1, int(0.99 * n))],
+                "max_ms": durations[-1],
+                "errors": sum(1 for s in spans if s.error),
+                "prompt_tokens": sum(s.attrs.get("prompt_tokens", 0) for s in spans),
+                "completion_tokens": sum(s.attrs.get("completion_tokens", 0) for s in spans),
+                "cached_tokens": sum(s.attrs.get("cached_tokens", 0) for s in spans),
+                "prefix_tokens": sum(s.attrs.get("prefix_tokens", 0) for s in spans),
+                "cost_usd": sum(self.cost(s) for s in spans),
+            }
+        return stats
+
+    def summary_table(self, top: int = 15) -> str:
+        stats = self.aggregate()
+        rows = sorted(stats.items(), key=lambda kv: -kv[1]["total_ms"])[:top]
+        header = (f"{'phase':<24}{'count':>7}{'total s':>10}{'mean ms':>10}{'p99 ms':>10}{'tokens in/out':>18}"
+                  f"{'cached':>8}{'cost $':>9}")
+        lines = [header, "-" * len(header)]
+        for name, st in rows:
+            tokens = f"{st['prompt_tokens']}/{st['completion_tokens']}" if st["prompt_tokens"] else "-"
+            # Share of input tokens served from the provider's prompt cache
+            cached = f"{100.0 * st['cached_tokens'] / st['prompt_tokens']:.0f}%" if st["prompt_tokens"] else "-"
+            lines.append(f"{name:<24}{st['count']:>7}{st['total_ms'] / 1000:>10.2f}{st['mean_ms']:>10.1f}"
+                         f"{st['p99_ms']:>10.1f}{tokens:>18}{cached:>8}{st['cost_usd']:>9.4f}")
+        return "\n".join(lines)
+
+    def export_prometheus(self, path: pathlib.Path) -> None:
+        """Prometheus text exposition format, one series per span name."""
+        out = [
+            "# HELP agent0_span_duration_seconds Wall time spent per run phase.",
+            "# TYPE agent0_span_duration_seconds summary",
+        ]
+        stats = self.aggregate()
+        for name, st in sorted(stats.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            out.append(f'agent0_span_duration_seconds_count{{span="{label}"}} {st["count"]}')
+            out.append(f'agent0_span_duration_seconds_sum{{span="{label}"}} {st["total_ms"] / 1000:.6f}')
+            out.append(f'agent0_span_duration_seconds{{span="{label}",quantile="0.5"}} {st["p50_ms"] / 1000:.6f}')
+            out.append(f'agent0_span_duration_seconds{{span="{label}",quantile="0.99"}} {st["p99_ms"] / 1000:.6f}')
+        out.append("# TYPE agent0_llm_tokens_total counter")
+        for name, st in sorted(stats.items()):
+            if st["prompt_tokens"] or st["completion_tokens"]:
+                out.append(f'agent0_llm_tokens_total{{span="{name}",kind="prompt"}} {st["prompt_tokens"]}')
+                out.append(f'agent0_llm_tokens_total{{span="{name}",kind="completion"}} {st["completion_tokens"]}')
+                out.append(f'agent0_llm_tokens_total{{span="{name}",kind="cached"}} {st["cached_tokens"]}')
+                out.append(f'agent0_llm_tokens_total{{span="{name}",kind="prefix_reused"}} {st["prefix_tokens"]}')
+        _write(path, "\n".join(out) + "\n")
+
+    def export_otlp_json(self, path: pathlib.Path, run_id: str) -> None:
+        """OTLP/JSON trace file (loadable by OpenTelemetry collectors' file receiver)."""
+        trace_id = hashlib.md5(run_id.encode("utf-8")).hexdigest()
+
+        def attr(k, v):
+            if isinstance(v, bool):
+                return {"key": k, "value": {"boolValue": v}}
+            if isinstance(v, int):
+                return {"key": k, "value": {"intValue": str(v)}}
+            if isinstance(v, float):
+                return {"key": k, "value": {"doubleValue": v}}
+            return {"key": k, "value": {"stringValue": str(v)}}
+
+        with self._lock:
+            spans = list(self.spans)
+        otlp_spans = []
+        for s in spans:
+            start_ns = int(s.start_wall * 1e9)
+            item = {
+                "traceId": trace_id,
+                "spanId": f"{s.span_id:016x}",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(s.duration_ms * 1e6)),
+                "attributes": [attr(k, v) for k, v in s.attrs.items()],
+                "status": {"code": 2 if s.error else 1},
+            }
+            if s.parent_id:
+                item["parentSpanId"] = f"{s.parent_id:016x}"
+            otlp_spans.append(item)
+        doc = {"resourceSpans": [{
+            "resource": {"attributes": [attr("service.name", "agent0"), attr("run.id", run_id)]},
+            "scopeSpans": [{"scope": {"name": "agent0.tracing"}, "spans": otlp_spans}],
+        }]}
+        _write(path, json.dumps(doc))
+
+def _write(path: pathlib.Path, text: str) -> None:
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+_TRACER = Tracer()
+
+def configure_tracing(log_func=None, pricing: Optional[Dict[str, Dict[str, float]]] = None) -> Tracer:
+    """Start a fresh tracer for a run; spans are also sent to log_func."""
+    global _TRACER
+    _TRACER = Tracer(log_func, pricing)
+    return _TRACER
+
+def get_tracer() -> Tracer:
+    return _TRACER
+
+def span(name: str, **attrs):
+    return _TRACER.span(name, **attrs)
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span (no-op outside a span)."""
+    s = _CURRENT.get()
+    if s is not None:
+        s.attrs.update(attrs)
@@ -1,11 +1,41 @@
 # core/workspace.py
 import os
 import pathlib
-from typing import List
+from typing import Dict, List, Optional, Union
+from core.index import get_index
+from core.tracing import span, annotate
 
 def read_text(path: pathlib.Path) -> str:
     return path.read_text(encoding="utf-8")
 
+def atomic_write_text(path: pathlib.Path, content: str) -> None:
+    """
+    Write via a temp file in the same directory + rename, so readers never see a partial file.
+    """
+    write_files({path: content})
+
+def write_files(files: Dict[pathlib.Path, Union[str, bytes]]) -> None:
+    """
+    Stage every file as a temp file first, then rename them into place. A failure
+    while staging leaves the workspace untouched. bytes are written as-is.
+    """
+    staged = []
+    try:
+        for path, content in files.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            if isinstance(content, bytes):
+                tmp.write_bytes(content)
+            else:
+                tmp.write_text(content, encoding="utf-8")
+            staged.append((tmp, path))
+    except BaseException:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+        raise
+    for tmp, path in staged:
+        os.replace(tmp, path)
+
 def ensure_in_workspace(rel_path: str, workspace_path: pathlib.Path) -> pathlib.Path:
     """
     Ensure a relative path resolves under workspace and cannot escape via '..'.
@@ -15,14 +45,16 @@ def ensure_in_workspace(rel_path: str, workspace_path: pathlib.Path) -> pathlib.
         raise RuntimeError(f"Path escapes workspace: {rel_path}")
     return p
 
-def repo_summary(workspace_path: pathlib.Path, max_files: int = 200) -> str:
-    files = []
-    for p in workspace_path.rglob("*"):
-        if p.is_file() and p.suffix in (".py", ".md", ".txt", ".json", ".yaml", ".yml", ".tex"):
-            files.append(str(p.relative_to(workspace_path)))
-            if len(files) >= max_files:
-                break
-    return "\n".join(files)
+def repo_summary(workspace_path: pathlib.Path, max_files: int = 200, max_tokens: Optional[int] = None) -> str:
+    """
+    Ranked summary of the workspace (paths + top-level outline), served from the
+    incremental workspace index. max_tokens bounds the summary size (max_files
+    only applies without it).
+    """
+    with span("repo_summary"):
+        index = get_index(workspace_path)
+        annotate(**index.update())
+        return index.summary(max_files=max_files, max_tokens=max_tokens)
 
 def ensure_package_structure(project_root: str, workspace_path: pathlib.Path):
     """Ensure all package directories have __init__.py files"""
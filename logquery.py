@@ -0,0 +1,108 @@
+# logquery.py
+"""
+Query the run logs through the SQLite index in runs/index.sqlite (core/log_index.py).
+Every command first ingests whatever was appended to runs/*.log.jsonl since the last
+call (--no-update skips that).
+
+    python logquery.py index
+    python logquery.py events --type rollback --since 2026-10-01 --limit 20
+    python logquery.py agg --by task_id --type test_result --data passed=false
+    python logquery.py agg --by data.role model --value duration_ms --span llm.call
+    python logquery.py sql "SELECT run_id, COUNT(*) FROM events GROUP BY run_id"
+
+Filters: --run-id, --role, --type, --task-id, --span, --model, --since/--until (ISO
+timestamps, compared as strings) and --data KEY=VALUE on the event's data (VALUE is
+parsed as JSON when possible, so passed=false matches the boolean).
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Any, List
+from core.log_index import INDEX_PATH, LOG_DIR, LogIndex
+
+def _data_filters(pairs: List[str]) -> Dict[str, Any]:
+    out = {}
+    for pair in pairs or []:
+        key, sep, raw = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--data expects KEY=VALUE, got '{pair}'")
+        try:
+            out[key] = json.loads(raw)
+        except ValueError:
+            out[key] = raw
+    return out
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "(no rows)"
+    cols = list(rows[0])
+    cells = [[_cell(r[c]) for c in cols] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(cols)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(cols, widths)), "  ".join("-" * w for w in widths)]
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+def _cell(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return "" if value is None else str(value)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Indexed queries over runs/*.log.jsonl.")
+    parser.add_argument("--index", default=str(INDEX_PATH), help="SQLite index file")
+    parser.add_argument("--logs", default=str(LOG_DIR), help="directory with the run logs")
+    parser.add_argument("--no-update", action="store_true", help="query the index as it is")
+    parser.add_argument("--json", action="store_true", help="print rows as JSON lines")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("index", help="ingest new log lines and print counts")
+    filters = argparse.ArgumentParser(add_help=False)
+    for col in ("run-id", "role", "type", "task-id", "span", "model"):
+        filters.add_argument(f"--{col}")
+    filters.add_argument("--since")
+    filters.add_argument("--until")
+    filters.add_argument("--data", action="append", metavar="KEY=VALUE")
+    filters.add_argument("--limit", type=int, default=50)
+    sub.add_parser("events", parents=[filters], help="matching events, newest first")
+    agg = sub.add_parser("agg", parents=[filters], help="counts (and value stats) per group")
+    agg.add_argument("--by", nargs="*", default=[], help="columns or data.<key> to group by")
+    agg.add_argument("--value", help="column or data.<key> to average, e.g. duration_ms")
+    sql = sub.add_parser("sql", help="run a read-only SQL statement against the events / files tables")
+    sql.add_argument("statement")
+    args = parser.parse_args(argv)
+
+    index = LogIndex(args.index, args.logs)
+    try:
+        if not args.no_update or args.command == "index":
+            start = time.perf_counter()
+            counts = index.update()
+            if args.command == "index":
+                print(f"{counts['events']} new events from {counts['read']} of {counts['files']} log files "
+                      f"in {(time.perf_counter() - start) * 1000:.0f} ms ({args.index})")
+                return 0
+        start = time.perf_counter()
+        if args.command == "sql":
+            rows = index.sql(args.statement)
+        else:
+            cols = {"run_id": args.run_id, "role": args.role, "type": args.type, "task_id": args.task_id,
+                    "span": args.span, "model": args.model}
+            common = dict(data=_data_filters(args.data), since=args.since, until=args.until, limit=args.limit, **cols)
+            if args.command == "events":
+                rows = [dict(r, data=json.dumps(r["data"])[:120]) for r in index.events(**common)]
+            else:
+                rows = index.aggregate(args.by, args.value, **common)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+
+    if args.json:
+        for r in rows:
+            print(json.dumps(r))
+    else:
+        print(format_table(rows))
+        print(f"{len(rows)} row(s) in {elapsed:.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
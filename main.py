@@ -1,4 +1,9 @@
+import argparse
 from orchestrator import run
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Plan, code and test the goal in config/tasks.yaml.")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="continue an earlier run from runs/<RUN_ID>.state.json, skipping completed tasks")
+    args = parser.parse_args()
+    run(resume=args.resume)
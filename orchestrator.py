@@ -1,64 +1,399 @@
 # orchestrator.py
 import pathlib
 from datetime import datetime
+from core.candidates import BestOfN
 from core.config import load_agents_cfg, load_policies_cfg, load_tasks_cfg
-from core.logging import log
+from core.execution import configure_execution
+from core.test_worker import shutdown_workers
+from core.logging import logger_from_cfg
+from core.scheduler import build_dag, run_dag, arun_dag
+from core.snapshot import get_store
+from core.speculation import Speculator
+from core.state import RunState
+from core.tracing import configure_tracing, span, annotate
 from agents.planner import PlannerAgent
 from agents.coder import CoderAgent
-from agents.tester import TesterAgent
+from agents.tester import TesterAgent, count_failures
+from utils.llm import configure_cache, configure_async, configure_backend, configure_prompt_cache, \
+    close_async_client
 
 RUN_ID = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
-LOG = pathlib.Path(f"runs/{RUN_ID}.log.jsonl")
+# Run logs and state files (benchmark.py points this at a temporary directory)
+RUNS_DIR = pathlib.Path("runs")
+LOG = RUNS_DIR / f"{RUN_ID}.log.jsonl"
 WS = pathlib.Path("workspace").resolve()
 RUN_TEST = False
+RETRY_ROLLBACK = False
+FIX_CANDIDATES = 1
 
-def run():
-    agents_cfg = load_agents_cfg()
-    policies = load_policies_cfg()
-    tasks_cfg = load_tasks_cfg()
+def _feedback(test_res) -> str:
+    """Coder feedback for a failed test: the optional diagnosis first, then the test report.
+    CoderAgent compacts it to its feedback_tokens budget."""
+    if test_res.get("diagnosis"):
+        return f"{test_res['diagnosis']}\n\n{test_res.get('report', '')}"
+    return test_res.get("report", "")
 
-    goal = tasks_cfg.get("goal") or tasks_cfg.get("mvp")
+def _resumed(t, state: RunState, log_func) -> bool:
+    """True if a resumed run already completed this task and its artifacts are unchanged."""
+    if state is None or not state.completed(t["id"], WS):
+        return False
+    print(f"Skipping task {t.get('id')} (completed in an earlier attempt of this run)")
+    log_func("orchestrator", "resume_skip", {"task_id": t["id"]})
+    return True
+
+def _record(state: RunState, t, edits=None, test_res=None) -> None:
+    if state is None:
+        return
+    if edits is not None:
+        state.record_edits(t["id"], edits, WS)
+    if test_res is not None:
+        state.record_test(t["id"], test_res)
+
+class _BestSoFar:
+    """
+    Best-so-far retries: snapshots the task's artifacts whenever a test result is at
+    least as good as the best seen, and rolls back a fix attempt that increased the
+    failure count, so the next attempt starts from the better version. Results are
+    only compared within one scope (the full suite, or one set of selected tests).
+    """
+
+    def __init__(self, t, log_func, state: RunState = None):
+        self.t = t
+        self.log_func = log_func
+        self.state = state
+        self.store = get_store(WS)
+        self.paths = list(t.get("artifacts", []) or [])
+        # Scope -> (failures, snapshot id, test result); scope None is the full suite
+        self.best = {}
+
+    @staticmethod
+    def _scope(test_res):
+        selected = test_res.get("selected_tests")
+        return None if selected is None else frozenset(selected)
+
+    def observe(self, test_res):
+        """Returns the result the retry loop should continue from."""
+        failures = count_failures(test_res)
+        scope = self._scope(test_res)
+        snap = self.store.snapshot(self.paths)
+        best = self.best.get(scope)
+        if best is None or snap == best[1] or failures <= best[0]:
+            self.best[scope] = (failures, snap, test_res)
+            return test_res
+        best_failures, best_snap, best_res = best
+        touched = self.store.restore(best_snap)
+        self.log_func("orchestrator", "rollback", {"task_id": self.t["id"], "snapshot": best_snap,
+                                                   "failures": failures, "best_failures": best_failures,
+                                                   "files": touched, "full_suite": scope is None})
+        if self.state:
+            self.state.record_restore(self.t["id"], touched, WS)
+        note = (f"The last fix attempt increased failing tests from {best_failures} to {failures} "
+                f"and was reverted. The files are back to the earlier version; these are its results.\n\n")
+        return dict(best_res, report=note + best_res.get("report", ""))
+
+def _tested(t, test_res, state: RunState = None, tracker: _BestSoFar = None):
+    _record(state, t, test_res=test_res)
+    return tracker.observe(test_res) if tracker else test_res
+
+def _best_of_n(coder: CoderAgent, tester: TesterAgent, project_root, test_folder_root, log_func):
+    """Parallel fix candidates per retry (fix_candidates > 1), prompt variants from the coder's fix_variants."""
+    if FIX_CANDIDATES <= 1:
+        return None
+    return BestOfN(coder, tester, WS, FIX_CANDIDATES, coder.conf.get("fix_variants"),
+                   project_root, test_folder_root, log_func)
+
+def run_task(t, coder: CoderAgent, tester: TesterAgent, project_root: str, test_folder_root: str,
+             max_retries: int, log_func, incremental: bool = False, state: RunState = None,
+             speculator: Speculator = None) -> bool:
+    """Code one task, then test -> (retry up to max_retries). Returns True if the task passed."""
+    if _resumed(t, state, log_func):
+        return True
+    with span("task", task_id=t.get("id", "")):
+        if state:
+            state.start(t["id"])
+        passed = False
+        try:
+            passed = _run_task(t, coder, tester, project_root, test_folder_root, max_retries, log_func,
+                               incremental, state, speculator)
+        finally:
+            if state:
+                state.finish(t["id"], passed, WS)
+        annotate(passed=passed)
+        return passed
+
+def _run_task(t, coder, tester, project_root, test_folder_root, max_retries, log_func, incremental, state,
+              speculator):
+    print(f"Coding task {t.get('id')}, task title: {t.get('title')}")
+    # A speculative proposal made while the previous task was under test, if still valid
+    result = speculator.take(t) if speculator else None
+    if result is None:
+        result = coder.code(t, WS, project_root=project_root, log_func=log_func)
+    edits = result["edits"]
+    _record(state, t, edits=edits)
+    if not RUN_TEST:
+        return True
+    if speculator:
+        speculator.start_after(t["id"])
+
+    # With incremental tests, only tests depending on the edited files run inside the loop
+    test_res = tester.test(t, WS, project_root, test_folder_root, log_func=log_func,
+                           changed=edits if incremental else None)
+    tracker = _BestSoFar(t, log_func, state) if RETRY_ROLLBACK else None
+    test_res = _tested(t, test_res, state, tracker)
+    candidates = _best_of_n(coder, tester, project_root, test_folder_root, log_func)
+    attempts = 0
+
+    while True:
+        if test_res.get("passed", False) and test_res.get("selected_tests") is not None:
+            # Selected tests pass; confirm against the full suite before finishing the task
+            test_res = tester.test(t, WS, project_root, test_folder_root, log_func=log_func)
+            test_res = _tested(t, test_res, state, tracker)
+            continue
+        if test_res.get("passed", False) or attempts >= max_retries:
+            break
+        attempts += 1
+        with span("task.retry", task_id=t.get("id", ""), attempt=attempts):
+            feedback = _feedback(test_res)
+            fix_task = dict(t)
+            fix_task["title"] = f"Fix failing tests for: {t.get('title','')}"
+            if candidates:
+                # One round: N fixes tested side by side, the best one promoted
+                edits, test_res = candidates.run(t, fix_task, feedback, test_res)
+                _record(state, t, edits=edits)
+                test_res = _tested(t, test_res, state, tracker)
+                continue
+            edits = coder.code(fix_task, WS, feedback=feedback, project_root=project_root, log_func=log_func)["edits"]
+            _record(state, t, edits=edits)
+            test_res = tester.test(t, WS, project_root, test_folder_root, log_func=log_func,
+                                   changed=edits if incremental else None)
+            test_res = _tested(t, test_res, state, tracker)
+
+    if not test_res.get("passed", False):
+        print(f"[HALT] Task {t.get('id')} still failing after {attempts} retries. See {LOG}")
+        return False
+    return True
+
+async def arun_task(t, coder: CoderAgent, tester: TesterAgent, project_root: str, test_folder_root: str,
+                    max_retries: int, log_func, incremental: bool = False, state: RunState = None,
+                    speculator: Speculator = None) -> bool:
+    """asyncio version of run_task; LLM calls and test subprocesses don't block other tasks."""
+    if _resumed(t, state, log_func):
+        return True
+    with span("task", task_id=t.get("id", "")):
+        if state:
+            state.start(t["id"])
+        passed = False
+        try:
+            passed = await _arun_task(t, coder, tester, project_root, test_folder_root, max_retries, log_func,
+                                      incremental, state, speculator)
+        finally:
+            if state:
+                state.finish(t["id"], passed, WS)
+        annotate(passed=passed)
+        return passed
+
+async def _arun_task(t, coder, tester, project_root, test_folder_root, max_retries, log_func, incremental, state,
+                     speculator):
+    print(f"Coding task {t.get('id')}, task title: {t.get('title')}")
+    result = (await speculator.atake(t)) if speculator else None
+    if result is None:
+        result = await coder.acode(t, WS, project_root=project_root, log_func=log_func)
+    edits = result["edits"]
+    _record(state, t, edits=edits)
+    if not RUN_TEST:
+        return True
+    if speculator:
+        speculator.astart_after(t["id"])
+
+    # With incremental tests, only tests depending on the edited files run inside the loop
+    test_res = await tester.atest(t, WS, project_root, test_folder_root, log_func=log_func,
+                                  changed=edits if incremental else None)
+    tracker = _BestSoFar(t, log_func, state) if RETRY_ROLLBACK else None
+    test_res = _tested(t, test_res, state, tracker)
+    candidates = _best_of_n(coder, tester, project_root, test_folder_root, log_func)
+    attempts = 0
+
+    while True:
+        if test_res.get("passed", False) and test_res.get("selected_tests") is not None:
+            # Selected tests pass; confirm against the full suite before finishing the task
+            test_res = await tester.atest(t, WS, project_root, test_folder_root, log_func=log_func)
+            test_res = _tested(t, test_res, state, tracker)
+            continue
+        if test_res.get("passed", False) or attempts >= max_retries:
+            break
+        attempts += 1
+        with span("task.retry", task_id=t.get("id", ""), attempt=attempts):
+            feedback = _feedback(test_res)
+            fix_task = dict(t)
+            fix_task["title"] = f"Fix failing tests for: {t.get('title','')}"
+            if candidates:
+                edits, test_res = await candidates.arun(t, fix_task, feedback, test_res)
+                _record(state, t, edits=edits)
+                test_res = _tested(t, test_res, state, tracker)
+                continue
+            edits = (await coder.acode(fix_task, WS, feedback=feedback, project_root=project_root,
+                                       log_func=log_func))["edits"]
+            _record(state, t, edits=edits)
+            test_res = await tester.atest(t, WS, project_root, test_folder_root, log_func=log_func,
+                                          changed=edits if incremental else None)
+            test_res = _tested(t, test_res, state, tracker)
+
+    if not test_res.get("passed", False):
+        print(f"[HALT] Task {t.get('id')} still failing after {attempts} retries. See {LOG}")
+        return False
+    return True
+
+def run(goal: str = None, workspace: pathlib.Path = None, run_id: str = None,
+        policies: dict = None, agents_cfg: dict = None, run_tests: bool = None,
+        resume: str = None) -> dict:
+    """
+    Plan and execute a goal. Defaults come from config/ (tasks.yaml, policies.yaml,
+    agents.yaml), ./workspace and a timestamp run id; callers such as benchmark.py
+    override them. Returns the scheduler status per task id.
+
+    Progress is checkpointed to runs/<run_id>.state.json. resume=<run_id> continues
+    that run: its goal, workspace and plan are reused and tasks that passed (with
+    unchanged artifacts) are skipped.
+    """
+    global RUN_ID, LOG, WS, RUN_TEST, RETRY_ROLLBACK, FIX_CANDIDATES
+    state = None
+    if resume:
+        state = RunState.load(resume, RUNS_DIR)
+        run_id = resume
+        goal = goal or state.data["goal"]
+        workspace = workspace or state.data["workspace"]
+    if run_id:
+        RUN_ID = run_id
+        LOG = RUNS_DIR / f"{RUN_ID}.log.jsonl"
+    if workspace:
+        WS = pathlib.Path(workspace).resolve()
+    if run_tests is not None:
+        RUN_TEST = run_tests
+    agents_cfg = agents_cfg or load_agents_cfg()
+    policies = policies or load_policies_cfg()
+    configure_backend(policies.get("llm_backend"))
+    configure_cache(policies.get("llm_cache"))
+    configure_prompt_cache(policies.get("prompt_cache"))
+    configure_async(policies.get("llm_async"))
+    configure_execution(policies.get("execution"))
+    incremental = bool(policies.get("incremental_tests", False))
+    RETRY_ROLLBACK = bool(policies.get("retry_rollback", False))
+    FIX_CANDIDATES = max(1, int(policies.get("fix_candidates", 1)))
+
+    if not goal:
+        tasks_cfg = load_tasks_cfg()
+        goal = tasks_cfg.get("goal") or tasks_cfg.get("mvp")
     if not goal:
         raise RuntimeError("No 'goal' found in config/tasks.yaml")
 
-    log("orchestrator", "start", {"goal": "initiate logging"}, LOG)
+    if state is None:
+        state = RunState.create(RUN_ID, goal, WS, RUNS_DIR)
+    log_func = logger_from_cfg(LOG, policies.get("logging"))
+    if resume:
+        log_func("orchestrator", "resume", {"run_id": RUN_ID, "tasks": state.summary()})
+    else:
+        log_func("orchestrator", "start", {"goal": "initiate logging"})
+    tracing = policies.get("tracing") or {}
+    tracer = configure_tracing(log_func, tracing.get("pricing"))
 
     # Initialize agents
     planner = PlannerAgent(agents_cfg)
     coder = CoderAgent(agents_cfg)
     tester = TesterAgent(agents_cfg)
 
-    # 1) Plan
-    plan = planner.plan(goal, WS, RUN_ID, lambda role, type_, data: log(role, type_, data, LOG))
+    try:
+        with span("run", run_id=RUN_ID):
+            if policies.get("async_pipeline", False):
+                import asyncio  # only the async pipeline needs it (slow to import)
+                status = asyncio.run(_arun(goal, planner, coder, tester, policies, log_func, incremental, state))
+            else:
+                plan = state.plan
+                if plan is None:
+                    with span("plan"):
+                        plan = planner.plan(goal, WS, RUN_ID, log_func)
+                    state.set_plan(plan)
+                tasks, deps, max_retries, max_parallel = _prepare(plan, policies, log_func)
+                speculator = _speculator(policies, max_parallel, coder, plan, log_func)
+                try:
+                    status = run_dag(
+                        tasks, deps,
+                        lambda t: run_task(t, coder, tester, plan.get("project_root"), plan.get("test_folder_root"),
+                                           max_retries, log_func, incremental, state, speculator),
+                        max_workers=max_parallel,
+                    )
+                finally:
+                    if speculator:
+                        speculator.close()
+    finally:
+        shutdown_workers()
+        # Rollback snapshots and candidate overlays are only needed within a run
+        get_store(WS).prune((policies.get("snapshots") or {}).get("max_age_seconds", 0))
+        _export_metrics(tracer, tracing, log_func)
+        log_func.close()
+
+    skipped = [tid for tid, s in status.items() if s == "skipped"]
+    if skipped:
+        print(f"Skipped tasks after failure: {', '.join(skipped)}")
+
+    print(f"Run complete. Log: {LOG}")
+    if any(s != "passed" for s in status.values()):
+        print(f"Resume with: python main.py --resume {RUN_ID}")
+    return status
+
+async def _arun(goal, planner, coder, tester, policies, log_func, incremental, state):
+    try:
+        plan = state.plan
+        if plan is None:
+            with span("plan"):
+                plan = await planner.aplan(goal, WS, RUN_ID, log_func)
+            state.set_plan(plan)
+        tasks, deps, max_retries, max_parallel = _prepare(plan, policies, log_func)
+        speculator = _speculator(policies, max_parallel, coder, plan, log_func)
+        try:
+            return await arun_dag(
+                tasks, deps,
+                lambda t: arun_task(t, coder, tester, plan.get("project_root"), plan.get("test_folder_root"),
+                                    max_retries, log_func, incremental, state, speculator),
+                max_workers=max_parallel,
+            )
+        finally:
+            if speculator:
+                speculator.close()
+    finally:
+        await close_async_client()
+
+def _export_metrics(tracer, tracing, log_func):
+    """Write the per-phase metrics configured in the `tracing` policy section."""
+    log_func("orchestrator", "metrics", tracer.aggregate())
+    prom = tracing.get("prometheus", "runs/{run_id}.metrics.prom")
+    if prom:
+        tracer.export_prometheus(pathlib.Path(prom.format(run_id=RUN_ID)))
+    otlp = tracing.get("otlp_json")
+    if otlp:
+        tracer.export_otlp_json(pathlib.Path(otlp.format(run_id=RUN_ID)), RUN_ID)
+    if tracing.get("summary", True):
+        print(tracer.summary_table())
+
+def _speculator(policies, max_parallel, coder, plan, log_func):
+    """A Speculator when speculative_coding is on and tasks run one at a time (with tests)."""
+    if not policies.get("speculative_coding", False) or max_parallel != 1 or not RUN_TEST:
+        return None
+    return Speculator(coder, plan.get("tasks", []), WS, plan.get("project_root"), log_func)
+
+def _prepare(plan, policies, log_func):
+    """Build the task DAG for a plan. Returns (tasks, deps, max_retries, max_parallel)."""
     tasks = plan.get("tasks", [])
-    project_root = plan.get("project_root")
-    test_folder_root = plan.get("test_folder_root")
-    
     if not tasks:
         raise RuntimeError("Planner returned no tasks.")
 
-    # 2) Iterate tasks: code -> test -> (retry up to max_task_retries)
+    # Schedule tasks over their dependency DAG: each runs code -> test -> (retry up to max_task_retries).
+    # Independent tasks run concurrently up to max_parallel_tasks; 1 keeps the strict sequential order.
     max_retries = int(policies.get("max_task_retries", 3))
-    for t in tasks:
-        print(f"Coding task {t.get('id')}, task title: {t.get('title')}")
-        coder.code(t, WS, project_root=project_root, log_func=lambda role, type_, data: log(role, type_, data, LOG))
-        if RUN_TEST:
-            test_res = tester.test(t, WS, project_root, test_folder_root, log_func=lambda role, type_, data: log(role, type_, data, LOG))
-            attempts = 0
-
-            while not test_res.get("passed", False) and attempts < max_retries:
-                attempts += 1
-                feedback = test_res.get("report", "")[:4000]
-                fix_task = dict(t)
-                fix_task["title"] = f"Fix failing tests for: {t.get('title','')}"
-                coder.code(fix_task, WS, feedback=feedback, project_root=project_root, log_func=lambda role, type_, data: log(role, type_, data, LOG))
-                test_res = tester.test(t, WS, project_root, test_folder_root, log_func=lambda role, type_, data: log(role, type_, data, LOG))
-
-            if not test_res.get("passed", False):
-                print(f"[HALT] Task {t.get('id')} still failing after {attempts} retries. See runs/{RUN_ID}.log.jsonl")
-                break
-
-    print(f"Run complete. Log: runs/{RUN_ID}.log.jsonl")
+    max_parallel = int(policies.get("max_parallel_tasks", 1))
+    deps = build_dag(tasks, WS)
+    log_func("orchestrator", "schedule", {"max_parallel_tasks": max_parallel,
+                                          "depends_on": {tid: sorted(d) for tid, d in deps.items()}})
+    return tasks, deps, max_retries, max_parallel
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
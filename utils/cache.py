@@ -0,0 +1,144 @@
+# utils/cache.py
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import Dict, Any, Optional
+
+CACHE_MODES = ("off", "record", "replay")
+
+class LLMCache:
+    """
+    Content-addressed on-disk cache for LLM responses.
+
+    Responses are stored as one JSON blob per key under `root`; a SQLite index
+    (safe for concurrent processes) tracks size and access times for eviction,
+    which runs at most every evict_interval seconds per process.
+    """
+
+    def __init__(self, root: str = ".cache/llm", mode: str = "off",
+                 max_bytes: int = 512 * 1024 * 1024, max_age_seconds: int = 30 * 24 * 3600,
+                 evict_interval: float = 60.0):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: '{mode}' (expected one of: {', '.join(CACHE_MODES)})")
+        self.root = pathlib.Path(root)
+        self.mode = mode
+        self.max_bytes = int(max_bytes)
+        self.max_age_seconds = int(max_age_seconds)
+        self.evict_interval = float(evict_interval)
+        self._last_evict = 0.0
+        if self.mode != "off":
+            self.root.mkdir(parents=True, exist_ok=True)
+            with self._connect() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    " key TEXT PRIMARY KEY, model TEXT, size INTEGER,"
+                    " created REAL, accessed REAL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_payload: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, system_prompt, user_payload):
+            data = part.encode("utf-8")
+            # Length-prefix each part so ("ab", "c") and ("a", "bc") never collide
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        return h.hexdigest()
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit; the connection is closed on exit
+        with closing(sqlite3.connect(str(self.root / "index.sqlite"), timeout=30, isolation_level=None)) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+
+    def _blob_path(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode == "off":
+            return None
+        path = self._blob_path(key)
+        try:
+            blob = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if self.max_age_seconds and time.time() - blob.get("created", 0) > self.max_age_seconds:
+            self.drop(key)
+            return None
+        with self._connect() as db:
+            db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return blob["response"]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        if self.mode == "off":
+            return
+        now = time.time()
+        path = self._blob_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"model": model, "created": now, "response": response}, ensure_ascii=False)
+        # Write-then-rename so concurrent readers never see a partial blob
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, path)
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, model, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model, len(data.encode("utf-8")), now, now),
+            )
+        if now - self._last_evict >= self.evict_interval:
+            self._last_evict = now
+            self.evict()
+
+    def drop(self, key: str) -> None:
+        """Remove an entry (e.g. a response the caller could not use)."""
+        if self.mode == "off":
+            return
+        try:
+            self._blob_path(key).unlink()
+        except FileNotFoundError:
+            pass
+        with self._connect() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self) -> None:
+        """Drop entries older than max_age_seconds, then least recently used ones over max_bytes."""
+        with self._connect() as db:
+            stale = []
+            if self.max_age_seconds:
+                cutoff = time.time() - self.max_age_seconds
+                stale = [k for (k,) in db.execute("SELECT key FROM entries WHERE created < ?", (cutoff,))]
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if self.max_bytes and total > self.max_bytes:
+                for k, size in db.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+                    if total <= self.max_bytes:
+                        break
+                    if k not in stale:
+                        stale.append(k)
+                        total -= size
+        for k in stale:
+            self.drop(k)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.mode == "off":
+            return {"mode": self.mode, "entries": 0, "bytes": 0}
+        with self._connect() as db:
+            count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"mode": self.mode, "entries": count, "bytes": size}
+
+def cache_from_cfg(cfg: Optional[Dict[str, Any]]) -> LLMCache:
+    """Build a cache from the `llm_cache` section of policies.yaml; AGENT0_LLM_CACHE overrides the mode."""
+    cfg = dict(cfg or {})
+    mode = os.getenv("AGENT0_LLM_CACHE") or cfg.get("mode", "off")
+    return LLMCache(
+        root=cfg.get("dir", ".cache/llm"),
+        mode=mode,
+        max_bytes=cfg.get("max_bytes", 512 * 1024 * 1024),
+        max_age_seconds=cfg.get("max_age_seconds", 30 * 24 * 3600),
+        evict_interval=cfg.get("evict_interval_seconds", 60.0),
+    )
@@ -0,0 +1,181 @@
+# utils/json_stream.py
+"""
+Incremental JSON parser for streamed completions. feed() accepts the text in
+arbitrary chunks; every value is reported as soon as it is complete:
+
+    on_open(path, kind)    a container starts ("object" / "array")
+    on_value(path, value)  a value (scalar or container) is complete
+
+path is the tuple of keys / indexes from the root, e.g. ("edits", 0, "path").
+A callback may raise StreamAbort to reject the document before it ends.
+"""
+import json
+import re
+from typing import Any, Callable, List, Tuple
+
+Path = Tuple[Any, ...]
+
+class StreamAbort(RuntimeError):
+    """A streamed response was rejected before it was complete (syntax, schema or policy)."""
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WS = " \t\r\n"
+_SCALAR_CHARS = set("0123456789+-.eEtruefalsn")
+
+# Parser states
+_VALUE, _VALUE_OR_END, _KEY, _KEY_OR_END, _COLON, _AFTER_VALUE, _STRING, _SCALAR, _END = range(9)
+
+class IncrementalJSONParser:
+    def __init__(self, on_value: Callable[[Path, Any], None] = None,
+                 on_open: Callable[[Path, str], None] = None):
+        self.on_value = on_value
+        self.on_open = on_open
+        # One frame per open container: [container, current key (objects only)]
+        self._stack: List[list] = []
+        self._state = _VALUE
+        self._token: List[str] = []   # raw text of the string / scalar being read
+        self._is_key = False
+        self._escape = False          # a chunk ended right after a backslash
+        self.chars = 0
+        self.value: Any = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == _END
+
+    def _path(self) -> Path:
+        return tuple(frame[1] if isinstance(frame[0], dict) else len(frame[0]) for frame in self._stack)
+
+    def _error(self, msg: str) -> StreamAbort:
+        return StreamAbort(f"Invalid JSON at char {self.chars}: {msg}")
+
+    def feed(self, chunk: str) -> None:
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self._state
+            if state == _STRING:
+                i = self._read_string(chunk, i)
+                continue
+            c = chunk[i]
+            if state == _SCALAR:
+                if c in _SCALAR_CHARS:
+                    self._token.append(c)
+                    i += 1
+                    continue
+                self._end_scalar()
+                continue  # re-read c in the state after the scalar
+            i += 1
+            if c in _WS:
+                continue
+            if state in (_VALUE, _VALUE_OR_END):
+                if c == "]" and state == _VALUE_OR_END:
+                    self._close()
+                else:
+                    self._start_value(c)
+            elif state in (_KEY, _KEY_OR_END):
+                if c == '"':
+                    self._state, self._is_key, self._token = _STRING, True, []
+                elif c == "}" and state == _KEY_OR_END:
+                    self._close()
+                else:
+                    raise self._error(f"expected a key, got {c!r}")
+            elif state == _COLON:
+                if c != ":":
+                    raise self._error(f"expected ':', got {c!r}")
+                self._state = _VALUE
+            elif state == _AFTER_VALUE:
+                top = self._stack[-1][0]
+                if c == ",":
+                    self._state = _KEY if isinstance(top, dict) else _VALUE
+                elif c == "}" and isinstance(top, dict):
+                    self._close()
+                elif c == "]" and isinstance(top, list):
+                    self._close()
+                else:
+                    raise self._error(f"unexpected {c!r}")
+            else:  # _END
+                raise self._error("trailing data after the document")
+        self.chars += n
+
+    def close(self) -> Any:
+        """End of input: returns the parsed document (StreamAbort if it is incomplete)."""
+        if self._state == _SCALAR and not self._stack:
+            self._end_scalar()
+        if self._state != _END:
+            raise self._error("truncated document")
+        return self.value
+
+    def _start_value(self, c: str) -> None:
+        if c == "{" or c == "[":
+            kind = "object" if c == "{" else "array"
+            if self.on_open:
+                self.on_open(self._path(), kind)
+            self._stack.append([{}, None] if c == "{" else [[], None])
+            self._state = _KEY_OR_END if c == "{" else _VALUE_OR_END
+        elif c == '"':
+            self._state, self._is_key, self._token = _STRING, False, []
+        elif c in _SCALAR_CHARS:
+            self._state, self._token = _SCALAR, [c]
+        else:
+            raise self._error(f"unexpected {c!r}")
+
+    def _read_string(self, chunk: str, i: int) -> int:
+        """Consume string text from chunk[i:]; returns the next index."""
+        n = len(chunk)
+        if self._escape:
+            self._token.append(chunk[i])
+            self._escape = False
+            i += 1
+        while i < n:
+            m = _STRING_SPECIAL.search(chunk, i)
+            if m is None:
+                self._token.append(chunk[i:])
+                return n
+            j = m.start()
+            self._token.append(chunk[i:j])
+            if m.group() == "\\":
+                self._token.append("\\")
+                if j + 1 < n:
+                    self._token.append(chunk[j + 1])
+                    i = j + 2
+                else:
+                    self._escape = True
+                    return n
+                continue
+            try:
+                text = json.loads('"' + "".join(self._token) + '"')
+            except json.JSONDecodeError as e:
+                raise self._error(f"bad string: {e.msg}")
+            if self._is_key:
+                self._stack[-1][1] = text
+                self._state = _COLON
+            else:
+                self._emit(text)
+            return j + 1
+        return n
+
+    def _end_scalar(self) -> None:
+        token = "".join(self._token)
+        try:
+            value = json.loads(token)
+        except json.JSONDecodeError:
+            raise self._error(f"bad literal {token!r}")
+        self._emit(value)
+
+    def _close(self) -> None:
+        container = self._stack.pop()[0]
+        self._emit(container)
+
+    def _emit(self, value: Any) -> None:
+        if self.on_value:
+            self.on_value(self._path(), value)
+        if not self._stack:
+            self.value = value
+            self._state = _END
+            return
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[0][frame[1]] = value
+        else:
+            frame[0].append(value)
+        self._state = _AFTER_VALUE
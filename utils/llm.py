@@ -1,26 +1,392 @@
 # utils/llm.py
+# asyncio is imported inside the async functions: it is slow to import and the
+# synchronous pipeline (and every batch / benchmark worker using it) never needs it
 import json
-import openai
 import os
-from dotenv import load_dotenv
-from typing import Any
+import random
+import time
+import weakref
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+from core.tracing import annotate
+from utils.cache import LLMCache, cache_from_cfg
+from utils.prompt_cache import PrefixTracker, tracker_from_cfg
 
-load_dotenv()
-CHATGPT_API_KEY = os.getenv("CHATGPT_API_KEY")
-openai.api_key = CHATGPT_API_KEY
+_CACHE: LLMCache = cache_from_cfg(None)
+# Prefix reuse estimate for every prompt sent (see utils/prompt_cache.py)
+_PREFIXES: Optional[PrefixTracker] = tracker_from_cfg(None)
+
+# Async client settings; see the `llm_async` section of policies.yaml
+_ASYNC_CFG: Dict[str, Any] = {
+    "max_concurrency_per_model": 4,
+    "max_connections": 32,
+    "keepalive_seconds": 30,
+    "max_retries": 5,
+    "backoff_base_seconds": 1.0,
+    "backoff_max_seconds": 30.0,
+}
+# One pooled HTTP session and one semaphore per model, per event loop
+_SESSIONS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_SEMAPHORES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+class LLMBackend:
+    """
+    Completion provider behind call_llm/acall_llm. Subclasses implement complete();
+    acomplete() defaults to running it in a thread. stream()/astream() yield the
+    completion in chunks and default to one chunk. Selected by the `llm_backend`
+    policy section (see configure_backend).
+    """
+    name = "base"
+
+    def complete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        import asyncio
+        return await asyncio.to_thread(self.complete, model, system_prompt, user_payload)
+
+    def stream(self, model: str, system_prompt: str, user_payload: str) -> Iterator[str]:
+        yield self.complete(model, system_prompt, user_payload)
+
+    async def astream(self, model: str, system_prompt: str, user_payload: str) -> AsyncIterator[str]:
+        yield await self.acomplete(model, system_prompt, user_payload)
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI chat completion API (key from CHATGPT_API_KEY / .env)."""
+    name = "openai"
+
+    def __init__(self):
+        import openai
+        from dotenv import load_dotenv
+        load_dotenv()
+        openai.api_key = os.getenv("CHATGPT_API_KEY")
+        if _ASYNC_CFG.get("api_base"):
+            openai.api_base = _ASYNC_CFG["api_base"]
+        self.openai = openai
+
+    def complete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        resp = self.openai.ChatCompletion.create(
+            model=model,
+            messages=_messages(system_prompt, user_payload),
+        )
+        _record_usage(resp)
+        return resp.choices[0].message.content
+
+    async def acomplete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        import asyncio
+        openai = self.openai
+        retryable = (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.APIConnectionError,
+            openai.error.Timeout,
+        )
+        openai.aiosession.set(_session())
+        max_retries = int(_ASYNC_CFG["max_retries"])
+        for attempt in range(max_retries + 1):
+            try:
+                resp = await openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=_messages(system_prompt, user_payload),
+                )
+                _record_usage(resp)
+                annotate(attempt=attempt)
+                return resp.choices[0].message.content
+            except retryable as e:
+                if attempt == max_retries:
+                    raise
+                await asyncio.sleep(_retry_delay(e, attempt))
+
+    def stream(self, model: str, system_prompt: str, user_payload: str) -> Iterator[str]:
+        resp = self.openai.ChatCompletion.create(
+            model=model,
+            messages=_messages(system_prompt, user_payload),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in resp:
+            yield from self._deltas(chunk)
+
+    async def astream(self, model: str, system_prompt: str, user_payload: str) -> AsyncIterator[str]:
+        openai = self.openai
+        openai.aiosession.set(_session())
+        resp = await openai.ChatCompletion.acreate(
+            model=model,
+            messages=_messages(system_prompt, user_payload),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in resp:
+            for text in self._deltas(chunk):
+                yield text
+
+    @staticmethod
+    def _deltas(chunk) -> Iterator[str]:
+        # With include_usage the last chunk has no choices, only the usage of the whole stream
+        _record_usage(chunk)
+        for choice in chunk.get("choices") or []:
+            text = (choice.get("delta") or {}).get("content")
+            if text:
+                yield text
+
+# Built lazily so importing this module needs neither the openai package nor a key
+_BACKEND: Optional[LLMBackend] = None
+# Cross-process cap on in-flight completions (a multiprocessing semaphore; see batch.py)
+_GLOBAL_LIMIT = None
+
+def configure_global_limit(semaphore) -> None:
+    """Share one semaphore between worker processes so they respect a global API quota."""
+    global _GLOBAL_LIMIT
+    _GLOBAL_LIMIT = semaphore
+
+def configure_backend(cfg: Optional[Dict[str, Any]]) -> LLMBackend:
+    """
+    Install the backend described by the `llm_backend` policy section:
+    type "openai" (default) or "mock" (offline; see utils/mock_llm.py). The
+    AGENT0_LLM_BACKEND environment variable overrides the type.
+    """
+    global _BACKEND
+    cfg = dict(cfg or {})
+    kind = os.getenv("AGENT0_LLM_BACKEND") or cfg.pop("type", "openai")
+    cfg.pop("type", None)
+    if kind == "openai":
+        _BACKEND = OpenAIBackend()
+    elif kind == "mock":
+        from utils.mock_llm import MockBackend
+        _BACKEND = MockBackend.from_cfg(cfg)
+    else:
+        raise ValueError(f"Unknown llm_backend type: '{kind}'")
+    return _BACKEND
+
+def get_backend() -> LLMBackend:
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = OpenAIBackend()
+    return _BACKEND
+
+def configure_cache(cfg: Optional[Dict[str, Any]]) -> LLMCache:
+    """
+    Install the response cache described by the `llm_cache` policy section.
+    """
+    global _CACHE
+    _CACHE = cache_from_cfg(cfg)
+    return _CACHE
+
+def configure_async(cfg: Optional[Dict[str, Any]]) -> None:
+    """
+    Apply the `llm_async` policy section. `api_base` points the client at another
+    OpenAI-compatible endpoint (e.g. a local stand-in server).
+    """
+    _ASYNC_CFG.update(cfg or {})
+    if _ASYNC_CFG.get("api_base") and isinstance(_BACKEND, OpenAIBackend):
+        _BACKEND.openai.api_base = _ASYNC_CFG["api_base"]
+
+def configure_prompt_cache(cfg: Optional[Dict[str, Any]]) -> Optional[PrefixTracker]:
+    """Apply the `prompt_cache` policy section (block_tokens, min_tokens, max_blocks, enabled)."""
+    global _PREFIXES
+    _PREFIXES = tracker_from_cfg(cfg)
+    return _PREFIXES
+
+def _track_prefix(model: str, system_prompt: str, user_payload: str) -> None:
+    """Annotate a request that is about to be sent with the prompt prefix seen before."""
+    if _PREFIXES is not None:
+        annotate(prefix_tokens=_PREFIXES.observe(model, system_prompt, user_payload))
+
+def _cache_lookup(model: str, system_prompt: str, user_payload: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return (key, cached_response); key is None when caching is off."""
+    cache = _CACHE
+    if cache.mode == "off":
+        return None, None
+    key = cache.key(model, system_prompt, user_payload)
+    cached = cache.get(key)
+    annotate(cache="hit" if cached is not None else "miss")
+    if cached is None and cache.mode == "replay":
+        raise RuntimeError(f"LLM cache miss in replay mode (model={model}, key={key[:12]})")
+    return key, cached
+
+def discard_cached(model: str, system_prompt: str, user_payload: str) -> None:
+    """
+    Drop the cached response for this request. Agents call it when a response fails
+    to parse or validate, so the next identical request goes to the model again
+    instead of replaying the bad answer.
+    """
+    cache = _CACHE
+    if cache.mode == "record":
+        cache.drop(cache.key(model, system_prompt, user_payload))
 
 def call_llm(model: str, system_prompt: str, user_payload: str) -> str:
     """
     Calls the chat completion API. Expects the model to return JSON (per prompts/system.md).
+    Responses go through the content-addressed cache unless its mode is 'off'.
+    """
+    key, cached = _cache_lookup(model, system_prompt, user_payload)
+    if cached is not None:
+        return cached
+
+    _track_prefix(model, system_prompt, user_payload)
+    if _GLOBAL_LIMIT is None:
+        text = get_backend().complete(model, system_prompt, user_payload)
+    else:
+        with _GLOBAL_LIMIT:
+            text = get_backend().complete(model, system_prompt, user_payload)
+    if key:
+        _CACHE.put(key, model, text)
+    return text
+
+async def acall_llm(model: str, system_prompt: str, user_payload: str) -> str:
+    """
+    Async counterpart of call_llm. Shares the response cache; requests go through a
+    pooled keep-alive session, are limited per model by a semaphore and retried with
+    backoff on rate limits and transient errors.
+    """
+    key, cached = _cache_lookup(model, system_prompt, user_payload)
+    if cached is not None:
+        return cached
+
+    _track_prefix(model, system_prompt, user_payload)
+    async with _semaphore(model):
+        if _GLOBAL_LIMIT is None:
+            text = await get_backend().acomplete(model, system_prompt, user_payload)
+        else:
+            await _aacquire_global()
+            try:
+                text = await get_backend().acomplete(model, system_prompt, user_payload)
+            finally:
+                _GLOBAL_LIMIT.release()
+    if key:
+        _CACHE.put(key, model, text)
+    return text
+
+def stream_llm(model: str, system_prompt: str, user_payload: str, on_text: Callable[[str], None]) -> str:
+    """
+    Like call_llm, but hands the completion to on_text chunk by chunk as it arrives.
+    on_text may raise (e.g. StreamAbort from utils/json_stream.py) to stop the stream
+    early: the response is closed, no further tokens are read and nothing is cached.
+    A cache hit is passed to on_text as a single chunk.
     """
-    resp = openai.ChatCompletion.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user",   "content": user_payload}
-        ],
-    )
-    return resp.choices[0].message.content
+    key, cached = _cache_lookup(model, system_prompt, user_payload)
+    if cached is not None:
+        on_text(cached)
+        return cached
+
+    _track_prefix(model, system_prompt, user_payload)
+    parts = []
+    start = time.perf_counter()
+    stream = get_backend().stream(model, system_prompt, user_payload)
+    try:
+        if _GLOBAL_LIMIT is not None:
+            _GLOBAL_LIMIT.acquire()
+        try:
+            for text in stream:
+                if not parts:
+                    annotate(stream=True, first_chunk_ms=(time.perf_counter() - start) * 1000.0)
+                parts.append(text)
+                on_text(text)
+        finally:
+            if _GLOBAL_LIMIT is not None:
+                _GLOBAL_LIMIT.release()
+    finally:
+        stream.close()
+    text = "".join(parts)
+    if key:
+        _CACHE.put(key, model, text)
+    return text
+
+async def astream_llm(model: str, system_prompt: str, user_payload: str, on_text: Callable[[str], None]) -> str:
+    """Async counterpart of stream_llm (per-model semaphore as in acall_llm)."""
+    key, cached = _cache_lookup(model, system_prompt, user_payload)
+    if cached is not None:
+        on_text(cached)
+        return cached
+
+    _track_prefix(model, system_prompt, user_payload)
+    parts = []
+    start = time.perf_counter()
+    async with _semaphore(model):
+        if _GLOBAL_LIMIT is not None:
+            await _aacquire_global()
+        try:
+            stream = get_backend().astream(model, system_prompt, user_payload)
+            try:
+                async for text in stream:
+                    if not parts:
+                        annotate(stream=True, first_chunk_ms=(time.perf_counter() - start) * 1000.0)
+                    parts.append(text)
+                    on_text(text)
+            finally:
+                await stream.aclose()
+        finally:
+            if _GLOBAL_LIMIT is not None:
+                _GLOBAL_LIMIT.release()
+    text = "".join(parts)
+    if key:
+        _CACHE.put(key, model, text)
+    return text
+
+def _messages(system_prompt: str, user_payload: str):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user",   "content": user_payload}
+    ]
+
+def _record_usage(resp) -> None:
+    usage = resp.get("usage") if hasattr(resp, "get") else getattr(resp, "usage", None)
+    if usage:
+        annotate(prompt_tokens=int(usage.get("prompt_tokens", 0)),
+                 completion_tokens=int(usage.get("completion_tokens", 0)))
+        # Prompt prefix served from the provider's cache (billed at the cached input rate)
+        details = usage.get("prompt_tokens_details") or {}
+        annotate(cached_tokens=int(details.get("cached_tokens") or 0))
+
+def _semaphore(model: str) -> "asyncio.Semaphore":
+    import asyncio
+    per_loop = _SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    if model not in per_loop:
+        per_loop[model] = asyncio.Semaphore(int(_ASYNC_CFG["max_concurrency_per_model"]))
+    return per_loop[model]
+
+async def _aacquire_global() -> None:
+    """Take a _GLOBAL_LIMIT slot, waiting off the event loop (as Executor.aslot)."""
+    import asyncio
+    limit = _GLOBAL_LIMIT
+    waiter = asyncio.ensure_future(asyncio.to_thread(limit.acquire))
+    try:
+        await asyncio.shield(waiter)
+    except asyncio.CancelledError:
+        # The thread still gets the slot eventually: hand it back then
+        waiter.add_done_callback(lambda f: None if f.cancelled() or f.exception() else limit.release())
+        raise
+
+def _session():
+    import asyncio
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        import aiohttp  # installed with openai; only needed on the async path
+        connector = aiohttp.TCPConnector(
+            limit=int(_ASYNC_CFG["max_connections"]),
+            keepalive_timeout=float(_ASYNC_CFG["keepalive_seconds"]),
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _SESSIONS[loop] = session
+    return session
+
+async def close_async_client() -> None:
+    """Close the pooled session of the running event loop (call before the loop ends)."""
+    import asyncio
+    session = _SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+def _retry_delay(err: Exception, attempt: int) -> float:
+    headers = getattr(err, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), float(_ASYNC_CFG["backoff_max_seconds"]))
+        except ValueError:
+            pass
+    delay = float(_ASYNC_CFG["backoff_base_seconds"]) * (2 ** attempt)
+    return min(delay, float(_ASYNC_CFG["backoff_max_seconds"])) * random.uniform(0.5, 1.0)
 
 def safe_json_loads(text: str, log_func=None) -> Any:
     try:
@@ -0,0 +1,300 @@
+# utils/mock_llm.py
+"""
+Offline LLM backend for benchmarks and dry runs (llm_backend.type: mock).
+
+Responses come from one of:
+  - "synthetic": valid planner/coder/tester/diagnosis JSON generated from the
+    request itself (plans from the .py paths named in the goal, or n_tasks
+    generated modules; coder output that makes the task's tests pass)
+  - a YAML script: ordered rules {role, match (regex), response, times}
+  - "replay:<dir>": responses recorded by the LLM cache under <dir>
+
+Each call sleeps for a latency drawn from a seeded distribution, optionally
+per model, so runs are reproducible. Usage is reported like the API does:
+prompt/completion token estimates, and cached_tokens from a local model of the
+provider's prompt prefix cache (utils/prompt_cache.py).
+"""
+import hashlib
+import json
+import math
+import pathlib
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from core.config import load_yaml
+from core.context import estimate_tokens
+from core.tracing import annotate
+from utils.cache import LLMCache
+from utils.llm import LLMBackend
+from utils.prompt_cache import PrefixTracker, tracker_from_cfg
+
+LATENCY_DISTS = ("fixed", "uniform", "normal", "lognormal")
+
+class Latency:
+    """
+    Call latency in milliseconds.
+      fixed:     ms
+      uniform:   low_ms .. high_ms
+      normal:    mean_ms, stddev_ms (clamped at 0)
+      lognormal: median_ms, sigma (heavy right tail, like real API latency)
+    """
+
+    def __init__(self, dist: str = "fixed", ms: float = 0.0, low_ms: float = 0.0, high_ms: float = 0.0,
+                 mean_ms: float = 0.0, stddev_ms: float = 0.0, median_ms: float = 0.0, sigma: float = 0.5,
+                 seed: int = 0):
+        if dist not in LATENCY_DISTS:
+            raise ValueError(f"Unknown latency distribution: '{dist}' (expected one of: {', '.join(LATENCY_DISTS)})")
+        self.dist = dist
+        self.ms, self.low_ms, self.high_ms = float(ms), float(low_ms), float(high_ms)
+        self.mean_ms, self.stddev_ms = float(mean_ms), float(stddev_ms)
+        self.median_ms, self.sigma = float(median_ms), float(sigma)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Seconds to wait for the next call."""
+        with self._lock:
+            if self.dist == "fixed":
+                ms = self.ms
+            elif self.dist == "uniform":
+                ms = self._rng.uniform(self.low_ms, self.high_ms)
+            elif self.dist == "normal":
+                ms = max(0.0, self._rng.gauss(self.mean_ms, self.stddev_ms))
+            else:
+                ms = self._rng.lognormvariate(math.log(max(self.median_ms, 1e-3)), self.sigma)
+        return ms / 1000.0
+
+def _input(user_payload: str) -> Dict[str, Any]:
+    """The JSON the agents append after '# INPUT'."""
+    _, sep, tail = user_payload.rpartition("# INPUT\n")
+    if not sep:
+        return {}
+    try:
+        return json.loads(tail)
+    except json.JSONDecodeError:
+        return {}
+
+def request_role(user_payload: str) -> str:
+    """Which agent sent the payload: planner, coder, tester, diagnose or unknown."""
+    data = _input(user_payload)
+    if "goal" in data:
+        return "planner"
+    if "context_files" in data:
+        return "coder"
+    if "acceptance" in data and "pytest_exit_code" in data:
+        return "diagnose"
+    if "pytest_exit_code" in data:
+        return "tester"
+    return "unknown"
+
+def _bucket(text: str) -> float:
+    """Deterministic value in [0, 1) for text."""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+
+class SyntheticResponder:
+    """
+    Generates schema-valid responses. Plans: one task per module path in the goal
+    (with a test file each), or n_tasks generated modules when the goal names none
+    or n_tasks is set. dependencies: "none" (independent tasks), "chain" (each
+    depends on the previous). A fail_rate share of tasks get a wrong implementation
+    on the first attempt, so the retry loop is exercised.
+    """
+
+    def __init__(self, n_tasks: Optional[int] = None, dependencies: str = "none",
+                 fail_rate: float = 0.0, root: str = "bench"):
+        self.n_tasks = int(n_tasks) if n_tasks else None
+        self.dependencies = dependencies
+        self.fail_rate = float(fail_rate)
+        self.root = root
+
+    def __call__(self, model: str, system_prompt: str, user_payload: str) -> str:
+        role = request_role(user_payload)
+        data = _input(user_payload)
+        if role == "planner":
+            return json.dumps(self._plan(data))
+        if role == "coder":
+            return json.dumps(self._edits(data["task"]))
+        if role == "tester":
+            return json.dumps({"task_id": data.get("task_id", "T1"), "passed": data["pytest_exit_code"] == 0,
+                               "report": str(data.get("pytest_output", ""))[-1000:]})
+        if role == "diagnose":
+            return json.dumps({"diagnosis": "Synthetic diagnosis: the implementation returns the wrong value."})
+        raise RuntimeError("Mock LLM: unrecognized request payload")
+
+    def _plan(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        goal = data.get("goal", "")
+        m = re.search(r"'?(workspace_\w+)/", goal)
+        root = self.root
+        modules = []
+        if not self.n_tasks:
+            for path in dict.fromkeys(re.findall(r"\b([\w/]+\.py)\b", goal)):
+                if "test" not in path and not path.endswith("__init__.py"):
+                    modules.append(path)
+        if not modules:
+            modules = [f"{root}/mod_{i}.py" for i in range(1, (self.n_tasks or 3) + 1)]
+        project_root = next((p.split("/")[0] for p in modules if "/" in p), root)
+        tasks = []
+        for i, path in enumerate(modules, 1):
+            stem = pathlib.PurePosixPath(path).stem
+            task = {
+                "id": f"T{i}",
+                "title": f"Implement {path}" + (f" ({m.group(1)})" if m else ""),
+                "rationale": "Synthetic benchmark task",
+                "acceptance": f"value() in {path} returns {i} in {project_root}/tests",
+                "artifacts": [path, f"{project_root}/tests/test_{stem}_{i}.py"],
+            }
+            task["depends_on"] = [f"T{i - 1}"] if self.dependencies == "chain" and i > 1 else []
+            tasks.append(task)
+        return {"plan_id": data.get("plan_id") or "plan_0001", "project_root": project_root,
+                "test_folder_root": f"{project_root}/tests", "tasks": tasks}
+
+    def _edits(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        tid = task.get("id", "T1")
+        n = int(tid[1:]) if tid[1:].isdigit() else 1
+        broken = "feedback" not in task and _bucket(tid) < self.fail_rate
+        edits = []
+        artifacts = task.get("artifacts", [])
+        module = next((a for a in artifacts if "test" not in a), None)
+        for path in artifacts:
+            if "test" in path and module:
+                mod = module[:-3].replace("/", ".")
+                content = (f"from {mod} import value\n\n\n"
+                           f"def test_value_{n}():\n    assert value() == {n}\n")
+            else:
+                content = (f'"""Synthetic module for {tid}."""\n\n\n'
+                           f"def value() -> int:\n    return {n + 1 if broken else n}\n")
+            edits.append({"path": path, "content": content})
+        return {"edits": edits}
+
+class ScriptedResponder:
+    """
+    Responses from a YAML script: {"rules": [{role, match, response, times}]}. The
+    first rule whose role and regex match the payload answers; `times` limits how
+    often a rule fires. A dict/list response is sent as JSON.
+    """
+
+    def __init__(self, path: str):
+        doc = load_yaml(path) or {}
+        self.rules: List[Dict[str, Any]] = [dict(r) for r in doc.get("rules", [])]
+        self._lock = threading.Lock()
+
+    def __call__(self, model: str, system_prompt: str, user_payload: str) -> str:
+        role = request_role(user_payload)
+        with self._lock:
+            for rule in self.rules:
+                if rule.get("role", role) != role:
+                    continue
+                if rule.get("match") and not re.search(rule["match"], user_payload):
+                    continue
+                if "times" in rule:
+                    if rule["times"] <= 0:
+                        continue
+                    rule["times"] -= 1
+                response = rule["response"]
+                return response if isinstance(response, str) else json.dumps(response)
+        raise RuntimeError(f"Mock LLM script has no rule for this {role} request")
+
+class ReplayResponder:
+    """Responses recorded by the LLM cache (llm_cache mode record) under cache_dir."""
+
+    def __init__(self, cache_dir: str):
+        self.cache = LLMCache(cache_dir, mode="replay")
+
+    def __call__(self, model: str, system_prompt: str, user_payload: str) -> str:
+        key = self.cache.key(model, system_prompt, user_payload)
+        text = self.cache.get(key)
+        if text is None:
+            raise RuntimeError(f"Mock LLM replay miss (model={model}, key={key[:12]})")
+        return text
+
+class MockBackend(LLMBackend):
+    name = "mock"
+
+    def __init__(self, responder, latency: Optional[Latency] = None,
+                 model_latency: Optional[Dict[str, Latency]] = None, stream_chunk_chars: int = 64,
+                 prefix_cache: Optional[PrefixTracker] = None):
+        self.responder = responder
+        self.latency = latency or Latency()
+        self.model_latency = model_latency or {}
+        # stream(): the call latency is spread evenly over chunks of this many characters
+        self.stream_chunk_chars = max(1, int(stream_chunk_chars))
+        # The "provider side" cache: separate from the client's tracker in utils/llm
+        self.prefix_cache = prefix_cache
+        self.calls = 0
+
+    @classmethod
+    def from_cfg(cls, cfg: Dict[str, Any]) -> "MockBackend":
+        """
+        cfg keys: responses ("synthetic" | script path | "replay:<dir>"), synthetic
+        (SyntheticResponder options), latency (Latency options), model_latency
+        (model -> Latency options), stream_chunk_chars, prompt_cache (PrefixTracker
+        options, or {enabled: false} to report no cached tokens).
+        """
+        responses = cfg.get("responses", "synthetic")
+        if responses == "synthetic":
+            responder = SyntheticResponder(**(cfg.get("synthetic") or {}))
+        elif responses.startswith("replay:"):
+            responder = ReplayResponder(responses[len("replay:"):])
+        else:
+            responder = ScriptedResponder(responses)
+        return cls(
+            responder,
+            Latency(**(cfg.get("latency") or {})),
+            {m: Latency(**opts) for m, opts in (cfg.get("model_latency") or {}).items()},
+            int(cfg.get("stream_chunk_chars", 64)),
+            tracker_from_cfg(cfg.get("prompt_cache")),
+        )
+
+    def _respond(self, model: str, system_prompt: str, user_payload: str, streamed: bool = False) -> str:
+        self.calls += 1
+        text = self.responder(model, system_prompt, user_payload)
+        annotate(prompt_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_payload))
+        if self.prefix_cache is not None:
+            annotate(cached_tokens=self.prefix_cache.observe(model, system_prompt, user_payload))
+        if not streamed:
+            annotate(completion_tokens=estimate_tokens(text))
+        return text
+
+    def _chunks(self, text: str) -> List[str]:
+        size = self.stream_chunk_chars
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def _delay(self, model: str) -> float:
+        return self.model_latency.get(model, self.latency).sample()
+
+    def complete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        time.sleep(self._delay(model))
+        return self._respond(model, system_prompt, user_payload)
+
+    async def acomplete(self, model: str, system_prompt: str, user_payload: str) -> str:
+        import asyncio
+        await asyncio.sleep(self._delay(model))
+        return self._respond(model, system_prompt, user_payload)
+
+    def stream(self, model: str, system_prompt: str, user_payload: str):
+        delay = self._delay(model)
+        text = self._respond(model, system_prompt, user_payload, streamed=True)
+        chunks, sent = self._chunks(text), 0
+        try:
+            for chunk in chunks:
+                time.sleep(delay / len(chunks))
+                sent += len(chunk)
+                yield chunk
+        finally:
+            # Only what was read is "paid for" (the consumer may stop early)
+            annotate(completion_tokens=estimate_tokens(text[:sent]))
+
+    async def astream(self, model: str, system_prompt: str, user_payload: str):
+        import asyncio
+        delay = self._delay(model)
+        text = self._respond(model, system_prompt, user_payload, streamed=True)
+        chunks, sent = self._chunks(text), 0
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(delay / len(chunks))
+                sent += len(chunk)
+                yield chunk
+        finally:
+            annotate(completion_tokens=estimate_tokens(text[:sent]))
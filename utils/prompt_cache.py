@@ -0,0 +1,60 @@
+# utils/prompt_cache.py
+"""
+Local model of provider-side prompt caching. Providers reuse the work for the
+longest prefix of a prompt they have seen recently, counted in fixed-size token
+blocks and only for prompts above a minimum length (OpenAI: 1024 tokens, then
+128-token steps). PrefixTracker hashes prompts the same way (chained hashes of
+block_tokens-sized blocks of system + user message, per model) and reports how
+many leading tokens were seen before. The mock backend uses one to report
+`cached_tokens` like the API does; utils/llm uses one to annotate every request
+with `prefix_tokens`, the reuse the prompt layout allows, whatever the provider
+reports.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# ~4 characters per token, as core.context.estimate_tokens
+CHARS_PER_TOKEN = 4
+
+class PrefixTracker:
+    def __init__(self, block_tokens: int = 128, min_tokens: int = 1024, max_blocks: int = 100000):
+        self.block_chars = max(1, int(block_tokens)) * CHARS_PER_TOKEN
+        self.min_chars = int(min_tokens) * CHARS_PER_TOKEN
+        self.max_blocks = int(max_blocks)
+        # Chained block hash -> None, in LRU order (oldest first)
+        self._blocks: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, system_prompt: str, user_payload: str) -> int:
+        """Record a prompt; returns the estimated number of its leading tokens seen before."""
+        text = f"{system_prompt}\n{user_payload}"
+        if len(text) < self.min_chars:
+            return 0
+        h = hashlib.sha1(model.encode("utf-8")).digest()
+        reused, hit = 0, True
+        with self._lock:
+            # Only whole blocks are cacheable
+            for start in range(0, len(text) - self.block_chars + 1, self.block_chars):
+                h = hashlib.sha1(h + text[start:start + self.block_chars].encode("utf-8")).digest()
+                if hit and h in self._blocks:
+                    self._blocks.move_to_end(h)
+                    reused += self.block_chars
+                    continue
+                hit = False
+                self._blocks[h] = None
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return reused // CHARS_PER_TOKEN
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+
+def tracker_from_cfg(cfg: Optional[Dict[str, Any]]) -> Optional[PrefixTracker]:
+    """Build a tracker from the `prompt_cache` policy section; None when `enabled` is false."""
+    cfg = dict(cfg or {})
+    if not cfg.pop("enabled", True):
+        return None
+    return PrefixTracker(**cfg)
@@ -1,19 +1,98 @@
-import jsonschema
-from typing import Dict, Any, List
+import pathlib
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+if not __package__:
+    # Run as a script (python utils/validation.py runs the self-test): make the repo root importable
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from core.tracing import span
+
+class SchemaValidationError(ValueError):
+    """
+    Data that doesn't match its schema. `message` is the reason, `path` the keys /
+    indexes of the offending value. Wraps jsonschema.ValidationError so callers
+    don't need to import jsonschema.
+    """
+
+    def __init__(self, message: str, path: Tuple[Any, ...] = (), schema: str = "schema"):
+        self.message = message
+        self.path = tuple(path)
+        self.schema = schema
+        where = "/".join(str(k) for k in self.path) or "<root>"
+        super().__init__(f"{schema}: {message} (at {where})")
+
+def _compile(schema: Dict[str, Any]):
+    import jsonschema  # slow to import (~100 ms); deferred until a document is validated
+    return jsonschema.Draft7Validator(schema)
+
+def _check(validator, data: Any, name: str, path: Tuple[Any, ...] = ()) -> None:
+    import jsonschema
+    try:
+        validator.validate(data)
+    except jsonschema.ValidationError as e:
+        raise SchemaValidationError(e.message, path + tuple(e.absolute_path), name) from e
 
 class SchemaValidator:
-    def __init__(self, schema: Dict[str, Any]):
+    def __init__(self, schema: Dict[str, Any], name: str = "schema"):
         self.schema = schema
-        self.validator = jsonschema.Draft7Validator(schema)
-    
+        self.name = name
+        self._validator = None
+
+    @property
+    def validator(self):
+        """The compiled validator, built on first use."""
+        if self._validator is None:
+            self._validator = _compile(self.schema)
+        return self._validator
+
     def validate(self, data: Dict[str, Any]) -> None:
-        """Validate data against the schema. Raises ValidationError if invalid."""
-        self.validator.validate(data)
+        """Validate data against the schema. Raises SchemaValidationError if invalid."""
+        with span("validate", schema=self.name):
+            _check(self.validator, data, self.name)
     
     def is_valid(self, data: Dict[str, Any]) -> bool:
         """Check if data is valid without raising exceptions."""
         return self.validator.is_valid(data)
 
+    def subschema(self, path: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        """The schema for the value at path (object keys / array indexes), None if unconstrained."""
+        schema = self.schema
+        for key in path:
+            schema = schema.get("items") if isinstance(key, int) else (schema.get("properties") or {}).get(key)
+            if not isinstance(schema, dict):
+                return None
+        return schema
+
+class StreamValidator:
+    """
+    Validates a document while it is parsed incrementally (utils/json_stream.py):
+    containers are type-checked when they open and every value is checked against
+    its sub-schema as soon as it is complete. Raises SchemaValidationError.
+    """
+
+    def __init__(self, validator: SchemaValidator):
+        self.validator = validator
+        # Compiled sub-schemas per path shape (array indexes collapsed to 0)
+        self._subs: Dict[Tuple[Any, ...], Any] = {}
+
+    def _sub(self, path: Tuple[Any, ...]):
+        shape = tuple(0 if isinstance(k, int) else k for k in path)
+        if shape not in self._subs:
+            schema = self.validator.subschema(shape)
+            self._subs[shape] = _compile(schema) if schema else None
+        return self._subs[shape]
+
+    def on_open(self, path: Tuple[Any, ...], kind: str) -> None:
+        sub = self._sub(path)
+        expected = sub.schema.get("type") if sub else None
+        if expected and expected != kind:
+            raise SchemaValidationError(f"{kind} is not of type '{expected}'", path, self.validator.name)
+
+    def on_value(self, path: Tuple[Any, ...], value: Any) -> None:
+        sub = self._sub(path)
+        if sub is not None:
+            _check(sub, value, self.validator.name, path)
+
 PLANNER_SCHEMA = {
     "type": "object",
     "required": ["plan_id", "project_root", "test_folder_root", "tasks"],
@@ -31,7 +110,8 @@ PLANNER_SCHEMA = {
                     "title": {"type": "string", "maxLength": 4000},
                     "rationale": {"type": "string", "maxLength": 4000},
                     "acceptance": {"type": "string", "maxLength": 4000},
-                    "artifacts": {"type": "array", "items": {"type": "string"}}
+                    "artifacts": {"type": "array", "items": {"type": "string"}},
+                    "depends_on": {"type": "array", "items": {"type": "string", "pattern": "^T\\d+$"}}
                 }
             }
         }
@@ -47,11 +127,28 @@ CODER_SCHEMA = {
             "type": "array",
             "items": {
                 "type": "object",
-                "required": ["path", "content"],
+                "required": ["path"],
                 "properties": {
                     "path": {"type": "string", "minLength": 1},
-                    "content": {"type": "string", "maxLength": 200000}
-                }
+                    "content": {"type": "string", "maxLength": 200000},
+                    "hunks": {
+                        "type": "array",
+                        "minItems": 1,
+                        "items": {
+                            "type": "object",
+                            "required": ["search", "replace"],
+                            "properties": {
+                                "search": {"type": "string", "maxLength": 200000},
+                                "replace": {"type": "string", "maxLength": 200000}
+                            }
+                        }
+                    }
+                },
+                # Either the full file content or search/replace hunks, never both
+                "oneOf": [
+                    {"required": ["content"]},
+                    {"required": ["hunks"]}
+                ]
             }
         }
     }
@@ -63,7 +160,17 @@ TESTER_SCHEMA = {
     "properties": {
         "task_id": {"type": "string", "pattern": "^T\\d+$"},
         "passed": {"type": "boolean"},
-        "report": {"type": "string", "maxLength": 4000}
+        "report": {"type": "string", "maxLength": 4000},
+        "diagnosis": {"type": "string", "maxLength": 4000},
+        "selected_tests": {"type": "array", "items": {"type": "string"}}
+    }
+}
+
+DIAGNOSIS_SCHEMA = {
+    "type": "object",
+    "required": ["diagnosis"],
+    "properties": {
+        "diagnosis": {"type": "string", "maxLength": 4000}
     }
 }
 
@@ -76,11 +183,12 @@ ERROR_SCHEMA = {
     }
 }
 
-# Validator instances
-PLANNER_VALIDATOR = SchemaValidator(PLANNER_SCHEMA)
-CODER_VALIDATOR = SchemaValidator(CODER_SCHEMA)
-TESTER_VALIDATOR = SchemaValidator(TESTER_SCHEMA)
-ERROR_VALIDATOR = SchemaValidator(ERROR_SCHEMA)
+# Validator instances (each compiles its schema on first use)
+PLANNER_VALIDATOR = SchemaValidator(PLANNER_SCHEMA, "planner")
+CODER_VALIDATOR = SchemaValidator(CODER_SCHEMA, "coder")
+TESTER_VALIDATOR = SchemaValidator(TESTER_SCHEMA, "tester")
+DIAGNOSIS_VALIDATOR = SchemaValidator(DIAGNOSIS_SCHEMA, "diagnosis")
+ERROR_VALIDATOR = SchemaValidator(ERROR_SCHEMA, "error")
 
 def main():
     # Test planner schema
@@ -110,6 +218,14 @@ def main():
     }
     
     CODER_VALIDATOR.validate(test_coder_data)
+
+    test_coder_patch_data = {
+        "edits": [
+            {"path": "src/stats.py", "hunks": [{"search": "'count': len(data)", "replace": "'count': len(data), 'n': len(data)"}]}
+        ]
+    }
+
+    CODER_VALIDATOR.validate(test_coder_patch_data)
     print("✅ Coder schema validation passed")
     
     # Test tester schema